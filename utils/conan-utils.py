@@ -4,7 +4,7 @@ import sys
 import traceback
 
 from dotenv import load_dotenv
-from impl import conan, conan_env
+from impl import conan, conan_env, conan_backend
 from impl.config import directories
 from impl.package_reference import PackageReference
 from impl.profiles import ConanProfiles
@@ -12,8 +12,15 @@ from impl.update_mirror import update_mirror
 from impl.upload import upload_all
 from impl.debug import enable_debug_processors, finalize_debug_processors, discard_debug_data
 from impl.remotes import add_remote, remove_remote, list_remotes
-from impl.remote_cache import upload_cache, delete_cache, list_cache, process_conan_cache, process_debug_cache
+from impl.remote_cache import upload_cache, delete_cache, list_cache, process_conan_cache, process_debug_cache, restore_cache
 from impl.build_order import get_build_order
+from impl.lockfile import get_lockfile_path
+from impl.build_journal import start_journal, load_journal
+from impl.tracing import enable_tracing, write_trace
+from impl.files import set_min_free_space, wait_for_removals, remove_trash_async
+from impl.compiler_cache import enable_compiler_cache
+from impl.recipe_analyzer import get_build_order_violations
+from impl.affected import get_affected_packages
 
 load_dotenv()
 
@@ -26,7 +33,7 @@ def add_recipe_options(parser):
 
 def add_profile_options(parser):
     parser.add_argument('--profile-build', type=str, help='Conan build profile', required=False)
-    parser.add_argument('--profile-host', type=str, help='Conan host profile', required=True)
+    parser.add_argument('--profile-host', type=str, help='Conan host profile. Not required with --resume', required=False)
 
 def add_common_build_options(parser, allow_single_package=True):
     add_profile_options(parser)
@@ -34,22 +41,31 @@ def add_common_build_options(parser, allow_single_package=True):
     parser.add_argument('--keep-sources', action='store_true', help='Do not clean up sources after building')
     parser.add_argument('--enable-debug-processor', action='append', help='Enable specific debug processor (symstore, sentry)', required=False)
     parser.add_argument('--skip-debug-data-upload', action='store_true', help='Do not upload or discard debug data. Useful with store-cache command')
+    parser.add_argument('--jobs', type=int, help='Number of packages from the build order processed in parallel. Dependency graph is resolved when greater than 1', required=False, default=1)
+    parser.add_argument('--compiler-cache', type=str, help='Directory of the compiler cache (ccache or sccache) used by all package builds', required=False)
+    parser.add_argument('--compiler-cache-tool', type=str, choices=['ccache', 'sccache'], help='Compiler cache to use. Defaults to ccache if it is installed', required=False)
+    parser.add_argument('--min-free-space', type=float, help='Free disk space in GB required to start a package build. Builds wait for the cleanup of previous packages below it', required=False, default=0)
     add_build_order_option(parser)
 
     if allow_single_package:
         parser.add_argument('--package', type=str, help='Package name', required=False)
         parser.add_argument('--version', type=str, help='Package version', required=False)
+        parser.add_argument('--resume', action='store_true', help='Continue the interrupted build order run, skipping completed packages. Profiles, remotes and build order are taken from the journal')
+
+def add_lockfile_option(parser, help:str):
+    parser.add_argument('--lockfile', type=str, nargs='?', const='', help=f'{help}. Defaults to build_order.lock in the temp directory when no path is given', required=False)
 
 def add_conan_command(subparser, name, description):
     subparser = subparser.add_parser(name, help=description)
     subparser.add_argument('--all', action='store_true', help='Execute command for all recipes in the directory. If not specified, only packages with config are processed', required=False)
+    subparser.add_argument('--jobs', type=int, help='Number of recipes processed in parallel. Output of every recipe is printed once it is done', required=False, default=1)
     add_build_order_option(subparser)
 
 def add_cache_options(parser, cache_id_required:bool, cache_id_present:bool):
     parser.add_argument('--group-id', type=str, help='Group ID', required=True)
     if cache_id_present:
         parser.add_argument('--cache-id', type=str, help='Cache ID', required=cache_id_required)
-        parser.add_argument('--compression', type=str, help='Compression used (gz, bz2, xz, none)', required=False, default='xz')
+        parser.add_argument('--compression', type=str, help='Compression used (gz, bz2, xz, zst, none). zst uses all CPU cores and requires `zstandard` package', required=False, default='xz')
     parser.add_argument('--remote', type=str, help='Artifactory remote (including repo)', required=False)
     parser.add_argument('--user', type=str, help='Artifactory user name', required=False)
     parser.add_argument('--password', type=str, help='Artifactory password', required=False)
@@ -66,6 +82,8 @@ def parse_args():
     parser.add_argument('--output-dir', type=str, help='Path to output directory. Overrides venv-dir and conan-home-dir.', required=False)
     parser.add_argument('--build-dir', type=str, help='Path to build directory.', required=False)
     parser.add_argument('--short-paths', action='store_true', help='Use short paths for Conan cache (Windows only)')
+    parser.add_argument('--trace-file', type=str, help='Write Chrome trace (Perfetto) JSON with the timings of all phases to the file', required=False)
+    parser.add_argument('--conan-backend', type=str, choices=['api', 'subprocess'], help='Run Conan commands using the Conan Python API or the Conan executable. API falls back to the executable when not available', required=False, default='api')
 
     subparsers = parser.add_subparsers(help='sub-command help', dest='subparser_name')
 
@@ -105,6 +123,13 @@ def parse_args():
     add_common_build_options(subparser)
     subparser.add_argument('--export-recipes', action='store_true', help='Export recipes to Conan cache before building')
     subparser.add_argument('--remote', action='append', help='Conan remote', required=False)
+    add_lockfile_option(subparser, 'Lockfile created by `install --single-graph` used to resolve dependencies')
+    subparser.add_argument('--incremental', action='store_true', help='Skip packages whose recipe, config and profiles did not change since the last successful build, if the binary is available')
+    subparser.add_argument('--prefetch-sources', type=int, help='Download sources of the next N packages from the build order while building', required=False, default=0)
+    subparser.add_argument('--downloads-per-host', type=int, help='Maximum number of source downloads from the same host when prefetching', required=False, default=2)
+    subparser.add_argument('--disk-budget', type=float, help='Disk space in GB for source and build folders of the packages. New builds wait and folders of finished packages are removed (largest first) to stay within it', required=False, default=0)
+    subparser.add_argument('--memory-aware-jobs', action='store_true', help='Limit compile and link jobs of every package to the available memory, using memory profiles from package configs or the build history. Packages wait until there is memory for them. Linux only; link jobs are limited only for packages built by CMake with Ninja')
+    subparser.add_argument('--affected-since', type=str, help='Build only packages affected by the changes since the git revision (or in the revision range), see `affected`', required=False)
 
     #===========================================================================
     # install
@@ -119,6 +144,8 @@ def parse_args():
     subparser.add_argument('--recipe-config', type=str, help='Path to the config file for the recipe', required=False)
     subparser.add_argument('--allow-build', action='store_true', help='Allow building from source')
     subparser.add_argument('--install-dir', type=str, help='Path to install directory', required=False)
+    subparser.add_argument('--single-graph', action='store_true', help='Install the whole build order as a single graph and write a lockfile for the following build and upload steps')
+    add_lockfile_option(subparser, 'Lockfile written by --single-graph')
 
     #===========================================================================
     # upload
@@ -128,6 +155,7 @@ def parse_args():
     subparser.add_argument('--binaries-remote', type=str, help='Binaries remote', required=False)
     subparser.add_argument('--upload-build-tools', action='store_true', help='Upload build tools')
     add_build_order_option(subparser)
+    add_lockfile_option(subparser, 'Lockfile created by `install --single-graph` used to select the uploaded revisions')
 
     #===========================================================================
     # update-mirror
@@ -171,6 +199,26 @@ def parse_args():
     add_recipe_options(subparser)
     add_profile_options(subparser)
     subparser.add_argument('--remote', action='append', help='Conan remote', required=False)
+    subparser.add_argument('--analyze', action='store_true', help='Print the critical path, total work, theoretical speedup and the most blocking packages using the build history')
+    subparser.add_argument('--workers', type=int, action='append', help='Worker count to estimate the speedup for. Can be specified multiple times', required=False)
+    subparser.add_argument('--waves', action='store_true', help='Print the packages grouped into waves that can be built in parallel')
+    subparser.add_argument('--output', type=str, help='Write the build order file (build tools and host packages) to the path', required=False)
+    subparser.add_argument('--platforms', type=str, help='Platforms of the sections written with --output, e.g. "linux|darwin" or "*". Defaults to the current platform', required=False)
+
+    #===========================================================================
+    # check-build-order
+    #===========================================================================
+    subparser = subparsers.add_parser('check-build-order', help='Check that packages in the build order follow their dependencies. Recipes are analyzed statically, Conan is not used')
+    add_build_order_option(subparser)
+    subparser.add_argument('--platform', type=str, action='append', help='Platform to check the build order for (win32, linux, darwin). Can be specified multiple times. Defaults to all platforms', required=False)
+
+    #===========================================================================
+    # affected
+    #===========================================================================
+    subparser = subparsers.add_parser('affected', help='Print packages changed in the git revision range and all packages depending on them, in build order')
+    subparser.add_argument('--since', type=str, help='Git revision or revision range. A single revision is compared with the working tree', required=True)
+    add_build_order_option(subparser)
+    subparser.add_argument('--platform', type=str, help='Platform of the build order. Defaults to the current platform', required=False)
 
     #===========================================================================
     # store-cache
@@ -178,6 +226,8 @@ def parse_args():
     subparser = subparsers.add_parser('store-cache', help='Store Conan cache to Artifactory')
     add_cache_options(subparser, True, True)
     subparser.add_argument('--metadata-file', type=str, help='Path to the metadata file', required=False)
+    subparser.add_argument('--compression-level', type=int, help='Compression level (1-22 for zst, 0-9 for other compressions). Defaults to the compression default', required=False)
+    subparser.add_argument('--format', type=str, dest='cache_format', choices=['archive', 'snapshot', 'packages'], help='Store the cache as a single archive, as a snapshot sharing unchanged files with the previous snapshots of the group, or as an archive per recipe and package revision', required=False, default='archive')
 
     #===========================================================================
     # delete-cache
@@ -198,6 +248,16 @@ def parse_args():
     add_cache_options(subparser, False, False)
     subparser.add_argument('--recipes-remote', type=str, help='Recipes remote', required=False)
     subparser.add_argument('--binaries-remote', type=str, help='Binaries remote', required=False)
+    add_build_order_option(subparser)
+
+    #===========================================================================
+    # restore-cache
+    #===========================================================================
+    subparser = subparsers.add_parser('restore-cache', help='Restore remote Conan cache into the Conan home')
+    add_cache_options(subparser, True, True)
+    add_build_order_option(subparser)
+    subparser.add_argument('--platform', type=str, help='Platform of the build order. Defaults to the current platform. Build order only applies to caches stored with `--format packages`', required=False)
+    subparser.add_argument('--jobs', type=int, help='Number of archives downloaded in parallel', required=False, default=8)
 
     #===========================================================================
     # process-debug-cache
@@ -206,7 +266,17 @@ def parse_args():
     add_cache_options(subparser, False, False)
 
 
-    return parser.parse_args()
+    args = parser.parse_args()
+
+    # Only the runs over the build order are journaled
+    if getattr(args, 'resume', False) and (getattr(args, 'package', None) or getattr(args, 'recipe', None) or getattr(args, 'single_graph', False)):
+        parser.error('--resume can not be used with --package, --recipe or --single-graph')
+
+    # Host profile is optional only when resuming, as the profiles are then taken from the journal
+    if hasattr(args, 'profile_host') and not args.profile_host and not getattr(args, 'resume', False):
+        parser.error('the following arguments are required: --profile-host')
+
+    return args
 
 def get_profiles(args):
     return ConanProfiles(args.profile_host, args.profile_build)
@@ -235,12 +305,50 @@ def resolve_recipe_config(args):
 def get_package_reference(args):
     return PackageReference(args.package, args.version)
 
+def get_lockfile(args, always:bool=False):
+    if args.lockfile is None and not always:
+        return None
+    return get_lockfile_path(args.lockfile)
+
+def get_selected_build_order(args):
+    build_order = get_build_order(args.build_order)
+
+    if getattr(args, 'affected_since', None):
+        build_order = get_affected_packages(args.affected_since, build_order)
+        print(f'Packages affected since {args.affected_since}: {", ".join(build_order) or "none"}', flush=True)
+
+    return build_order
+
+def open_journal(args):
+    if args.resume:
+        return load_journal(args.subparser_name)
+    return start_journal(args.subparser_name, get_selected_build_order(args), get_profiles(args), args.remote)
+
+def check_build_order(args):
+    violations_found = False
+
+    for platform in args.platform or ['win32', 'linux', 'darwin']:
+        violations = get_build_order_violations(get_build_order(args.build_order, platform))
+
+        for package_name, dependency, conditional in violations:
+            if conditional:
+                print(f'{platform}: warning: `{package_name}` is listed before its conditional dependency `{dependency}`')
+            else:
+                print(f'{platform}: `{package_name}` is listed before its dependency `{dependency}`')
+                violations_found = True
+
+    if violations_found:
+        raise Exception('Build order does not follow the dependencies of the recipes')
+
+    print('Build order follows the dependencies of the recipes')
+
 def run_conan_command(args):
     if args.subparser_name == 'build':
         if args.package:
-            conan.build_package(get_package_reference(args), get_profiles(args), args.remote, args.export_recipes, args.keep_sources)
+            conan.build_package(get_package_reference(args), get_profiles(args), args.remote, args.export_recipes, args.keep_sources, get_lockfile(args))
         else:
-            conan.build_all(get_build_order(args.build_order), get_profiles(args), args.remote, args.export_recipes, args.keep_sources)
+            journal = open_journal(args)
+            conan.build_all(journal.build_order, journal.profiles, journal.remotes, args.export_recipes, args.keep_sources, args.jobs, get_lockfile(args), args.incremental, journal, args.prefetch_sources, args.downloads_per_host, int(args.disk_budget * 1024 * 1024 * 1024), args.memory_aware_jobs)
     elif args.subparser_name == 'install':
         if args.install_dir:
             directories.install_dir = args.install_dir
@@ -251,13 +359,16 @@ def run_conan_command(args):
             conan.install_recipe(args.recipe, resolve_recipe_config(args), get_profiles(args), args.remote, args.allow_build, args.keep_sources)
         elif args.package:
             conan.install_package(get_package_reference(args), get_profiles(args), args.remote, args.allow_build, args.keep_sources)
+        elif args.single_graph:
+            conan.install_all_single_graph(get_build_order(args.build_order), get_profiles(args), args.remote, args.allow_build, args.keep_sources, get_lockfile(args, always=True))
         else:
-            conan.install_all(get_build_order(args.build_order), get_profiles(args), args.remote, args.allow_build, args.keep_sources)
+            journal = open_journal(args)
+            conan.install_all(journal.build_order, journal.profiles, journal.remotes, args.allow_build, args.keep_sources, args.jobs, journal)
 
     elif args.subparser_name == 'clean':
         conan.clean()
     elif args.subparser_name == 'upload':
-        upload_all(args.recipes_remote, args.binaries_remote, args.upload_build_tools, get_build_order(args.build_order))
+        upload_all(args.recipes_remote, args.binaries_remote, args.upload_build_tools, get_build_order(args.build_order), get_lockfile(args))
     elif args.subparser_name == 'add-remote':
         add_remote(args.name, args.url)
     elif args.subparser_name == 'list-remotes':
@@ -266,16 +377,18 @@ def run_conan_command(args):
         remove_remote(args.name)
     elif args.subparser_name == 'validate-recipe':
         if args.export_recipes:
-            conan.execute_conan_command('export-recipes', False, get_build_order(args.build_order))
+            conan.execute_conan_command('export-recipes', False, get_build_order(args.build_order), args.jobs)
 
         directories.install_dir = directories.build_dir
+        if args.jobs > 1:
+            directories.isolate_package_builds = True
 
-        conan.install_or_build_all(get_build_order(args.build_order), get_profiles(args), args.remote, True, False)
+        conan.install_or_build_all(get_build_order(args.build_order), get_profiles(args), args.remote, True, False, args.jobs)
         conan.install_recipe(args.recipe, resolve_recipe_config(args), get_profiles(args), args.remote, True, False)
     elif args.subparser_name == 'build-order':
-        print(conan.print_build_order(args.recipe, resolve_recipe_config(args), get_profiles(args), args.remote))
+        print(conan.print_build_order(args.recipe, resolve_recipe_config(args), get_profiles(args), args.remote, args.analyze, args.workers, args.waves, args.output, args.platforms))
     else:
-        conan.execute_conan_command(args.subparser_name, args.all, get_build_order(args.build_order))
+        conan.execute_conan_command(args.subparser_name, args.all, get_build_order(args.build_order), args.jobs)
 
 def main(args):
     if args.subparser_name == 'init-env':
@@ -287,6 +400,10 @@ def main(args):
             print(conan_env.get_conan_home_path())
         if args.version:
             print(conan_env.get_conan_version())
+    elif args.subparser_name == 'check-build-order':
+        check_build_order(args)
+    elif args.subparser_name == 'affected':
+        print('\n'.join(get_affected_packages(args.since, get_build_order(args.build_order, args.platform))))
     elif args.subparser_name == 'update-mirror':
         update_mirror(args.remote, args.user, args.password, args.key, args.all)
     elif args.subparser_name == 'store-cache':
@@ -298,7 +415,9 @@ def main(args):
             group_id=args.group_id,
             cache_id=args.cache_id,
             compression=args.compression,
-            metadata_file=args.metadata_file)
+            metadata_file=args.metadata_file,
+            compression_level=args.compression_level,
+            cache_format=args.cache_format)
     elif args.subparser_name == 'delete-cache':
         delete_cache(
             remote=args.remote,
@@ -323,7 +442,20 @@ def main(args):
             key=args.key,
             group_id=args.group_id,
             recipes_remote=args.recipes_remote,
-            binaries_remote=args.binaries_remote)
+            binaries_remote=args.binaries_remote,
+            build_order=args.build_order)
+    elif args.subparser_name == 'restore-cache':
+        restore_cache(
+            remote=args.remote,
+            username=args.user,
+            password=args.password,
+            key=args.key,
+            group_id=args.group_id,
+            cache_id=args.cache_id,
+            compression=args.compression,
+            build_order=args.build_order,
+            platform=args.platform,
+            jobs=args.jobs)
     elif args.subparser_name == 'process-debug-cache':
         process_debug_cache(
             remote=args.remote,
@@ -353,6 +485,22 @@ if __name__ == "__main__":
     if args.short_paths and sys.platform.lower() == 'win32':
         directories.force_short_paths()
 
+    conan_backend.set_backend_type(args.conan_backend)
+
+    if args.trace_file:
+        enable_tracing(args.trace_file)
+
+    if getattr(args, 'compiler_cache', None):
+        enable_compiler_cache(args.compiler_cache, args.compiler_cache_tool)
+
+    if hasattr(args, 'min_free_space'):
+        set_min_free_space(int(args.min_free_space * 1024 * 1024 * 1024))
+
+    # Folders moved to the trash by an interrupted run. Only the commands which build packages or clean
+    # the cache wait for the removals, other commands should not be slowed down by them
+    if args.subparser_name in ('build', 'install', 'validate-recipe', 'clean'):
+        remove_trash_async()
+
     if hasattr(args, 'enable_debug_processor'):
         skip_upload = hasattr(args, 'skip_debug_data_upload') and args.skip_debug_data_upload
         enable_debug_processors(args.enable_debug_processor, skip_upload)
@@ -364,4 +512,6 @@ if __name__ == "__main__":
         traceback.print_exc()
         sys.exit(1)
     finally:
+        wait_for_removals()
         finalize_debug_processors()
+        write_trace()
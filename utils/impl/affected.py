@@ -0,0 +1,60 @@
+import os
+import subprocess
+
+from impl.build_analysis import get_dependents, get_downstream
+from impl.config import directories
+from impl.recipe_analyzer import get_static_dependency_graph
+
+
+def get_changed_files(revision_range:str) -> list[str]:
+    '''
+    Returns absolute paths of files changed in the revision range. A single revision is compared with the working tree
+    '''
+    root_dir = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'], cwd=directories.recipes_dir).decode('utf-8').strip()
+    output = subprocess.check_output(['git', 'diff', '--name-only', revision_range], cwd=root_dir).decode('utf-8')
+
+    return [os.path.realpath(os.path.join(root_dir, path)) for path in output.splitlines() if path]
+
+
+def __get_relative_parts(path:str, directory:str) -> list[str]:
+    directory = os.path.realpath(directory)
+
+    if os.path.commonpath([path, directory]) != directory:
+        return None
+
+    return os.path.relpath(path, directory).split(os.sep)
+
+
+def get_changed_packages(changed_files:list[str], build_order:list[str]) -> set[str]:
+    changed = set()
+
+    for path in changed_files:
+        if __get_relative_parts(path, directories.profiles_dir) is not None:
+            # Profiles affect every package
+            return set(build_order)
+
+        parts = __get_relative_parts(path, directories.recipes_dir)
+        if parts and len(parts) > 1:
+            changed.add(parts[0])
+            continue
+
+        parts = __get_relative_parts(path, directories.config_packages_dir)
+        if parts and parts[-1].endswith('.yml'):
+            changed.add(os.path.splitext(parts[-1])[0])
+
+    return changed
+
+
+def get_affected_packages(revision_range:str, build_order:list[str]) -> list[str]:
+    '''
+    Returns packages changed in the revision range and all packages depending on them, in build order
+    '''
+    changed = get_changed_packages(get_changed_files(revision_range), build_order)
+
+    dependents = get_dependents(get_static_dependency_graph(sorted(set(build_order) | changed)))
+
+    affected = set(changed)
+    for package_name in changed:
+        affected |= get_downstream(dependents, package_name)
+
+    return [package_name for package_name in build_order if package_name in affected]
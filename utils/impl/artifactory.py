@@ -54,6 +54,47 @@ class ArtifactoryInstance:
             else:
                 return response.json()['downloadUri']
 
+    def __get_stored_checksums(self, remote_path:str, response_json:dict) -> dict:
+        checksums = response_json.get('checksums', None)
+
+        if not checksums:
+            response = self.session.get(f'{self.url}/api/storage/{self.repo}/{remote_path}')
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to get checksums of {remote_path}: {response.text}")
+            checksums = response.json()['checksums']
+
+        return checksums
+
+    def upload_stream(self, remote_path:str, chunks) -> str:
+        '''
+        Uploads the data from the iterable using chunked transfer encoding. Checksums are computed
+        while uploading and compared with the ones of the stored file
+        '''
+        hashers = { 'sha1': sha1(), 'sha256': sha256(), 'md5': md5() }
+
+        def hashed_chunks():
+            for chunk in chunks:
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+                yield chunk
+
+        url = f'{self.url}/{self.repo}/{remote_path}'
+
+        response = self.session.put(url, data=hashed_chunks(), headers={ 'Content-Type': 'application/octet-stream' })
+        if response.status_code != 201:
+            raise RuntimeError(f"Failed to upload file to {url}: {response.text}")
+
+        response_json = response.json()
+        stored_checksums = self.__get_stored_checksums(remote_path, response_json)
+
+        for name, hasher in hashers.items():
+            stored = stored_checksums.get(name, None)
+            if stored and stored != hasher.hexdigest():
+                self.delete_uri(remote_path)
+                raise RuntimeError(f"Checksum mismatch for {url}: {name} is {stored}, expected {hasher.hexdigest()}")
+
+        return response_json['downloadUri']
+
     def get_file_url(self, remote_path:str) -> str:
         return f'{self.url}/{self.repo}/{remote_path}' if not remote_path.startswith(self.url) else remote_path
 
@@ -80,6 +121,16 @@ class ArtifactoryInstance:
 
         return hasher.hexdigest()
 
+    def get_stream(self, remote_path:str, chunk_size:int=1024 * 1024):
+        '''
+        Yields chunks of the remote file without storing it
+        '''
+        with self.session.get(self.get_file_url(remote_path), stream=True) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to download file from {self.get_file_url(remote_path)}: {response.text}")
+
+            yield from response.iter_content(chunk_size=chunk_size)
+
     def delete_uri(self, remote_path:str) -> None:
         response = self.session.delete(self.get_file_url(remote_path))
         if response.status_code != 204:
@@ -0,0 +1,137 @@
+from impl.build_history import format_duration
+
+
+def get_dependents(dependencies:dict[str, set[str]]) -> dict[str, set[str]]:
+    dependents = { package_name: set() for package_name in dependencies.keys() }
+
+    for package_name, package_dependencies in dependencies.items():
+        for dependency in package_dependencies:
+            dependents.setdefault(dependency, set()).add(package_name)
+
+    return dependents
+
+
+def get_downstream(dependents:dict[str, set[str]], package_name:str) -> set[str]:
+    downstream = set()
+    stack = [package_name]
+
+    while stack:
+        for dependent in dependents.get(stack.pop(), set()):
+            if dependent not in downstream:
+                downstream.add(dependent)
+                stack.append(dependent)
+
+    return downstream
+
+
+def get_build_waves(dependencies:dict[str, set[str]]) -> list[list[str]]:
+    '''
+    Topologically sorts the packages (Kahn's algorithm) into waves.
+    Packages of a wave depend only on packages from the previous waves
+    '''
+    dependents = get_dependents(dependencies)
+    remaining_dependencies = { package_name: len(dependencies.get(package_name, set())) for package_name in dependents.keys() }
+
+    waves = []
+    wave = sorted(package_name for package_name, count in remaining_dependencies.items() if count == 0)
+
+    while wave:
+        waves.append(wave)
+        next_wave = []
+
+        for package_name in wave:
+            for dependent in dependents[package_name]:
+                remaining_dependencies[dependent] -= 1
+                if remaining_dependencies[dependent] == 0:
+                    next_wave.append(dependent)
+
+        wave = sorted(next_wave)
+
+    if sum(len(wave) for wave in waves) != len(remaining_dependencies):
+        cycle = sorted(package_name for package_name, count in remaining_dependencies.items() if count > 0)
+        raise RuntimeError(f'Dependency graph contains a cycle: {", ".join(cycle)}')
+
+    return waves
+
+
+def get_critical_path(dependencies:dict[str, set[str]], durations:dict[str, float]) -> tuple[list[str], float]:
+    '''
+    Returns the chain of packages with the largest total duration and that duration
+    '''
+    finish_times = {}
+    predecessors = {}
+    visiting = set()
+
+    def get_finish_time(package_name:str):
+        if package_name not in finish_times:
+            if package_name in visiting:
+                raise RuntimeError(f'Dependency graph contains a cycle: {", ".join(sorted(visiting))}')
+            visiting.add(package_name)
+
+            predecessor = max(dependencies.get(package_name, set()), key=get_finish_time, default=None)
+            predecessors[package_name] = predecessor
+            finish_times[package_name] = durations.get(package_name, 0.0) + (get_finish_time(predecessor) if predecessor else 0.0)
+        return finish_times[package_name]
+
+    if not dependencies:
+        return [], 0.0
+
+    last = max(dependencies.keys(), key=get_finish_time)
+
+    path = []
+    while last:
+        path.append(last)
+        last = predecessors[last]
+
+    path.reverse()
+
+    return path, finish_times[path[-1]]
+
+
+def analyze_build_order(dependencies:dict[str, set[str]], known_durations:dict[str, float], workers:list[int]) -> str:
+    packages = sorted(dependencies.keys())
+
+    known_durations = { name: duration for name, duration in known_durations.items() if name in dependencies }
+    default_duration = sum(known_durations.values()) / len(known_durations) if known_durations else 1.0
+    durations = { package_name: known_durations.get(package_name, default_duration) for package_name in packages }
+
+    total_work = sum(durations.values())
+    critical_path, critical_path_duration = get_critical_path(dependencies, durations)
+
+    lines = []
+
+    if len(known_durations) < len(packages):
+        missing = [package_name for package_name in packages if package_name not in known_durations]
+        lines.append(f'No build history for {len(missing)} packages, assuming {format_duration(default_duration)} for: {", ".join(missing)}')
+        lines.append('')
+
+    lines.append(f'Packages: {len(packages)}')
+    lines.append(f'Total work: {format_duration(total_work)}')
+    lines.append(f'Critical path: {format_duration(critical_path_duration)}')
+
+    for package_name in critical_path:
+        lines.append(f'  {package_name:<32} {format_duration(durations[package_name])}')
+
+    lines.append('')
+    lines.append('Theoretical speedup:')
+
+    for worker_count in workers:
+        wall_time = max(critical_path_duration, total_work / worker_count)
+        lines.append(f'  {worker_count:>3} workers: {total_work / wall_time:5.2f}x ({format_duration(wall_time)})')
+
+    lines.append(f'  unbounded:   {total_work / critical_path_duration if critical_path_duration else 1.0:5.2f}x ({format_duration(critical_path_duration)})')
+
+    dependents = get_dependents(dependencies)
+    blocking = sorted(
+        ((package_name, get_downstream(dependents, package_name)) for package_name in packages),
+        key=lambda item: (-len(item[1]), item[0]))
+
+    lines.append('')
+    lines.append('Packages blocking the most others:')
+
+    for package_name, downstream in blocking[:10]:
+        if not downstream:
+            break
+        lines.append(f'  {package_name:<32} {len(downstream):>3} packages, {format_duration(sum(durations[name] for name in downstream))} of work')
+
+    return '\n'.join(lines)
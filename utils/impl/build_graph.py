@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from impl.conan_recipe_store import get_recipe
+from impl.package_reference import PackageReference
+from impl.profiles import ConanProfiles
+from impl.tracing import trace
+
+
+def get_package_dependencies(build_order:list[str], package_name:str, profiles:ConanProfiles, remotes:list[str] = None) -> set[str]:
+    try:
+        recipe = get_recipe(PackageReference(package_name=package_name))
+        return recipe.get_dependencies(profiles, remotes) & set(build_order)
+    except Exception as e:
+        # Without the graph, the only safe assumption is that the package needs everything before it
+        print(f'Failed to resolve dependencies for `{package_name}`, assuming it depends on all previous packages: {e}', flush=True)
+        return set(build_order[:build_order.index(package_name)])
+
+
+def get_dependency_graph(build_order:list[str], profiles:ConanProfiles, remotes:list[str] = None, jobs:int=1) -> dict[str, set[str]]:
+    print(f'Resolving dependency graph for {len(build_order)} packages...', flush=True)
+
+    def resolve(package_name:str):
+        return package_name, get_package_dependencies(build_order, package_name, profiles, remotes)
+
+    with trace('get_dependency_graph', 'graph', packages=len(build_order)), ThreadPoolExecutor(max_workers=max(1, jobs or 1)) as executor:
+        return dict(executor.map(resolve, build_order))
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import threading
+import time
+
+from impl.conan_env import get_conan_home_path
+from impl.profiles import ConanProfiles
+
+__lock = threading.Lock()
+
+# Number of latest builds used to estimate the duration of the next one
+__history_depth = 5
+
+
+def get_history_path():
+    return os.path.join(os.path.dirname(os.path.abspath(get_conan_home_path())), 'build_history.sqlite3')
+
+
+def __connect():
+    con = sqlite3.connect(get_history_path())
+    con.execute('''
+        CREATE TABLE IF NOT EXISTS builds (
+            package TEXT NOT NULL,
+            version TEXT NOT NULL,
+            profile TEXT NOT NULL,
+            duration REAL NOT NULL,
+            peak_rss INTEGER,
+            cpu_time REAL,
+            finished_at REAL NOT NULL
+        )''')
+
+    # Columns added after the history was introduced
+    columns = { row[1] for row in con.execute('PRAGMA table_info(builds)') }
+    if 'disk_usage' not in columns:
+        con.execute('ALTER TABLE builds ADD COLUMN disk_usage INTEGER')
+
+    con.execute('CREATE INDEX IF NOT EXISTS builds_package ON builds (package, profile, finished_at)')
+    return con
+
+
+def get_profile_key(profiles:ConanProfiles):
+    return os.path.splitext(os.path.basename(profiles.host_profile))[0]
+
+
+def record_build(package_name:str, package_version:str, profiles:ConanProfiles, duration:float, peak_rss:int=None, cpu_time:float=None, disk_usage:int=None):
+    with __lock:
+        con = __connect()
+        try:
+            con.execute(
+                'INSERT INTO builds (package, version, profile, duration, peak_rss, cpu_time, disk_usage, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (package_name, package_version, get_profile_key(profiles), duration, peak_rss or None, cpu_time, disk_usage or None, time.time()))
+            con.commit()
+        finally:
+            con.close()
+
+
+def __get_latest_average(con:sqlite3.Connection, column:str, package_name:str, profile:str=None):
+    query = f'SELECT AVG({column}) FROM (SELECT {column} FROM builds WHERE package = ? AND {column} IS NOT NULL'
+    params = [package_name]
+
+    if profile:
+        query += ' AND profile = ?'
+        params.append(profile)
+
+    query += ' ORDER BY finished_at DESC LIMIT ?)'
+    params.append(__history_depth)
+
+    return con.execute(query, params).fetchone()[0]
+
+
+def get_expected_values(column:str, package_names:list[str], profiles:ConanProfiles) -> dict[str, float]:
+    '''
+    Average of the latest builds for the same host profile, or for any profile when the package was not built with it yet
+    '''
+    if not os.path.exists(get_history_path()):
+        return {}
+
+    profile = get_profile_key(profiles)
+    values = {}
+
+    with __lock:
+        con = __connect()
+        try:
+            for package_name in package_names:
+                value = __get_latest_average(con, column, package_name, profile)
+                if value is None:
+                    value = __get_latest_average(con, column, package_name)
+                if value is not None:
+                    values[package_name] = value
+        finally:
+            con.close()
+
+    return values
+
+
+def get_expected_durations(package_names:list[str], profiles:ConanProfiles) -> dict[str, float]:
+    return get_expected_values('duration', package_names, profiles)
+
+
+def get_expected_peak_rss(package_names:list[str], profiles:ConanProfiles) -> dict[str, float]:
+    return get_expected_values('peak_rss', package_names, profiles)
+
+
+def get_expected_disk_usage(package_names:list[str], profiles:ConanProfiles) -> dict[str, float]:
+    return get_expected_values('disk_usage', package_names, profiles)
+
+
+def format_duration(seconds:float):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f'{seconds // 3600}h {seconds % 3600 // 60:02d}m'
+    if seconds >= 60:
+        return f'{seconds // 60}m {seconds % 60:02d}s'
+    return f'{seconds}s'
@@ -0,0 +1,87 @@
+import os
+import threading
+
+import yaml
+
+from impl.config import directories
+from impl.package_config_provider import package_config_provider
+from impl.profiles import ConanProfiles
+
+
+def get_journal_path():
+    return os.path.join(directories.temp_dir, 'build_journal.yml')
+
+
+def __get_package_options(build_order:list[str]) -> dict[str, str]:
+    options = {}
+
+    for package_name in build_order:
+        config = package_config_provider.get_package_config(package_name)
+        options[package_name] = config.get('options', '') if config else ''
+
+    return options
+
+
+class BuildJournal:
+    def __init__(self, command:str, build_order:list[str], profiles:ConanProfiles, remotes:list[str], options:dict[str, str], completed:list[str] = None):
+        self.command = command
+        self.build_order = build_order
+        self.profiles = profiles
+        self.remotes = remotes
+        self.options = options
+        self.completed = completed or []
+        self.lock = threading.Lock()
+
+    def save(self):
+        os.makedirs(os.path.dirname(get_journal_path()), exist_ok=True)
+
+        with open(get_journal_path(), 'w') as f:
+            yaml.dump({
+                'command': self.command,
+                'build_order': self.build_order,
+                'profile_host': self.profiles.host_profile,
+                'profile_build': self.profiles.build_profile,
+                'remotes': self.remotes,
+                'options': self.options,
+                'completed': self.completed,
+            }, f, sort_keys=False)
+
+    def mark_completed(self, package_name:str):
+        with self.lock:
+            self.completed.append(package_name)
+            self.save()
+
+    def finish(self):
+        if os.path.exists(get_journal_path()):
+            os.unlink(get_journal_path())
+
+
+def start_journal(command:str, build_order:list[str], profiles:ConanProfiles, remotes:list[str]) -> BuildJournal:
+    journal = BuildJournal(command, build_order, profiles, remotes, __get_package_options(build_order))
+    journal.save()
+    return journal
+
+
+def load_journal(command:str) -> BuildJournal:
+    journal_path = get_journal_path()
+
+    if not os.path.exists(journal_path):
+        raise Exception(f'Nothing to resume, journal {journal_path} does not exist')
+
+    with open(journal_path, 'r') as f:
+        journal = yaml.safe_load(f)
+
+    if journal['command'] != command:
+        raise Exception(f'Journal {journal_path} was created by `{journal["command"]}`, cannot resume `{command}`')
+
+    build_order = journal['build_order']
+
+    if __get_package_options(build_order) != journal['options']:
+        raise Exception('Package options changed since the journal was created, run without --resume')
+
+    profiles = ConanProfiles(journal['profile_host'], journal['profile_build'])
+
+    print(f'Resuming `{command}` with {len(journal["completed"])} of {len(build_order)} packages completed', flush=True)
+    print(f'Using profiles {profiles.host_profile} and {profiles.build_profile}', flush=True)
+
+    return BuildJournal(command, build_order, profiles, journal['remotes'], journal['options'], journal['completed'])
@@ -31,3 +31,24 @@ def get_build_order(build_order_name:str, platform:str=None):
                 build_order += part['packages']
 
     return build_order
+
+
+def write_build_order(build_order_path:str, sections:list[tuple[str, str, list[list[str]]]]):
+    '''
+    Writes the build order file. Every section is a tuple of (title, platforms, waves)
+    '''
+    lines = ['build_order:']
+
+    for title, platforms, waves in sections:
+        if not any(waves):
+            continue
+
+        lines.append(f'  - platforms: "{platforms}"')
+        lines.append('    packages:')
+
+        for index, wave in enumerate(waves):
+            lines.append(f'    # {title}, wave {index + 1}')
+            lines += [f'    - {package_name}' for package_name in wave]
+
+    with open(build_order_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
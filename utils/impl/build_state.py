@@ -0,0 +1,91 @@
+import hashlib
+import os
+import threading
+
+import yaml
+
+from impl.config import directories
+from impl.conan_env import get_conan_home_path
+from impl.conan_recipe import ConanRecipe
+from impl.profiles import ConanProfiles, get_profile_files
+
+
+def __is_ignored_dir(name:str):
+    # Local sources, build folders, test package and folders left by background removals do not affect the package binary
+    return name in ('src', 'test_package', '__pycache__', '.trash') or name.startswith('build')
+
+
+def __update_with_file(hasher, path:str):
+    with open(path, 'rb') as f:
+        while chunk := f.read(65536):
+            hasher.update(chunk)
+
+
+def get_package_config_paths(package_name:str) -> list[str]:
+    paths = [
+        os.path.join(directories.config_platform_packages_dir, f'{package_name}.yml'),
+        os.path.join(directories.config_packages_dir, f'{package_name}.yml'),
+    ]
+
+    return [path for path in paths if os.path.exists(path)]
+
+
+def compute_input_hash(recipe:ConanRecipe, profiles:ConanProfiles, dependency_hashes:dict[str, str] = None) -> str:
+    '''
+    Hash of everything the package binary is built from: the recipe folder (including conandata.yml),
+    the package config, the profiles with their includes and the input hashes of the dependencies
+    '''
+    hasher = hashlib.sha256()
+    hasher.update(str(recipe.reference).encode('utf-8'))
+
+    for root, dirs, files in os.walk(recipe.recipe_dir):
+        dirs[:] = sorted(d for d in dirs if not __is_ignored_dir(d))
+
+        for file in sorted(files):
+            if file == 'CMakeUserPresets.json' or file.endswith('.pyc'):
+                continue
+
+            path = os.path.join(root, file)
+            hasher.update(os.path.relpath(path, recipe.recipe_dir).replace('\\', '/').encode('utf-8'))
+            __update_with_file(hasher, path)
+
+    # Profiles are hashed with the profiles they include
+    profile_paths = get_profile_files(profiles.host_profile) + get_profile_files(profiles.build_profile)
+
+    for path in get_package_config_paths(recipe.reference.name) + profile_paths:
+        hasher.update(os.path.basename(path).encode('utf-8'))
+        __update_with_file(hasher, path)
+
+    for name, dependency_hash in sorted((dependency_hashes or {}).items()):
+        hasher.update(f'{name}={dependency_hash}'.encode('utf-8'))
+
+    return hasher.hexdigest()
+
+
+class BuildState:
+    def __init__(self, path:str=None):
+        self.path = path or os.path.join(get_conan_home_path(), 'conan_utils_build_state.yml')
+        self.packages = {}
+        self.lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                state = yaml.safe_load(f)
+                if state and state.get('packages'):
+                    self.packages = state['packages']
+
+    @staticmethod
+    def get_profiles_key(profiles:ConanProfiles):
+        return f'{os.path.basename(profiles.host_profile)}|{os.path.basename(profiles.build_profile)}'
+
+    def get_hash(self, recipe:ConanRecipe, profiles:ConanProfiles) -> str:
+        with self.lock:
+            return self.packages.get(str(recipe.reference), {}).get(self.get_profiles_key(profiles), None)
+
+    def set_hash(self, recipe:ConanRecipe, profiles:ConanProfiles, input_hash:str):
+        with self.lock:
+            self.packages.setdefault(str(recipe.reference), {})[self.get_profiles_key(profiles)] = input_hash
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'w') as f:
+                yaml.dump({ 'packages': self.packages }, f, sort_keys=True)
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import stat
+
+from concurrent.futures import ThreadPoolExecutor
+
+from impl.artifactory import ArtifactoryInstance
+from impl.compression import create_compressor, create_decompressor, get_file_suffix
+from impl.tracing import trace
+
+# Snapshot manifests are stored next to the cache archives, blobs are shared by the whole group
+snapshot_suffix = '.snapshot.json'
+
+__chunk_size = 1024 * 1024
+
+
+def __hash_file(path:str) -> str:
+    hasher = hashlib.sha256()
+
+    with open(path, 'rb') as f:
+        while chunk := f.read(__chunk_size):
+            hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+def create_snapshot_manifest(sources:list[tuple[str, str]], compression:str) -> dict:
+    '''
+    Creates the manifest of a snapshot from (local path, path in snapshot) pairs. Files are identified by sha256
+    '''
+    files = []
+    links = []
+    dirs = []
+
+    def add_file(path:str, snapshot_path:str):
+        if os.path.islink(path):
+            links.append({ 'path': snapshot_path, 'target': os.readlink(path) })
+        else:
+            files.append({
+                'path': snapshot_path,
+                'sha256': __hash_file(path),
+                'size': os.path.getsize(path),
+                'mode': stat.S_IMODE(os.stat(path).st_mode),
+            })
+
+    for source_path, snapshot_root in sources:
+        if not os.path.isdir(source_path):
+            add_file(source_path, snapshot_root)
+            continue
+
+        for root, dir_names, file_names in os.walk(source_path):
+            relative_root = os.path.relpath(root, source_path).replace(os.sep, '/')
+            snapshot_dir = snapshot_root if relative_root == '.' else f'{snapshot_root}/{relative_root}'
+
+            if not dir_names and not file_names:
+                dirs.append(snapshot_dir)
+
+            for name in file_names:
+                add_file(os.path.join(root, name), f'{snapshot_dir}/{name}')
+
+            # Symlinks to directories are stored as links
+            for name in list(dir_names):
+                if os.path.islink(os.path.join(root, name)):
+                    add_file(os.path.join(root, name), f'{snapshot_dir}/{name}')
+                    dir_names.remove(name)
+
+    return {
+        'version': 1,
+        'compression': compression,
+        'files': sorted(files, key=lambda file: file['path']),
+        'links': sorted(links, key=lambda link: link['path']),
+        'dirs': sorted(dirs),
+    }
+
+
+def get_blob_path(group_id:str, sha256:str, compression:str) -> str:
+    return f'{group_id}/blobs/{sha256[:2]}/{sha256}{get_file_suffix(compression)}'
+
+
+def __read_compressed(path:str, compression:str, level:int):
+    compressor = create_compressor(compression, level)
+
+    with open(path, 'rb') as f:
+        while chunk := f.read(__chunk_size):
+            if compressed := compressor.compress(chunk):
+                yield compressed
+
+    if compressed := compressor.flush():
+        yield compressed
+
+
+def __get_existing_manifest(artifactory:ArtifactoryInstance, manifest_path:str) -> dict:
+    if not artifactory.file_exists(manifest_path):
+        return None
+    return json.loads(b''.join(artifactory.get_stream(manifest_path)))
+
+
+def upload_snapshot(artifactory:ArtifactoryInstance, group_id:str, manifest_path:str, sources:list[tuple[str, str]], compression:str, level:int=None, jobs:int=8) -> str:
+    '''
+    Uploads the files missing from the group blobs and the snapshot manifest
+    '''
+    with trace('create snapshot manifest', 'remote_cache', path=manifest_path):
+        manifest = create_snapshot_manifest(sources, compression)
+
+    if __get_existing_manifest(artifactory, manifest_path) == manifest:
+        print(f'Snapshot {manifest_path} is up to date, skipping upload', flush=True)
+        return artifactory.get_file_url(manifest_path)
+
+    existing_blobs = set(artifactory.list_files(f'{group_id}/blobs'))
+
+    local_paths = {}
+    for source_path, snapshot_root in sources:
+        for file in manifest['files']:
+            if file['path'] == snapshot_root:
+                local_paths.setdefault(file['sha256'], source_path)
+            elif file['path'].startswith(f'{snapshot_root}/'):
+                local_paths.setdefault(file['sha256'], os.path.join(source_path, file['path'][len(snapshot_root) + 1:]))
+
+    missing = { sha256: path for sha256, path in local_paths.items() if get_blob_path(group_id, sha256, compression) not in existing_blobs }
+
+    total_size = sum(file['size'] for file in manifest['files'])
+    missing_size = sum(os.path.getsize(path) for path in missing.values())
+    print(f'Snapshot has {len(local_paths)} unique files ({total_size // (1024 * 1024)} MB), uploading {len(missing)} missing ({missing_size // (1024 * 1024)} MB)', flush=True)
+
+    def upload_blob(item:tuple[str, str]):
+        sha256, path = item
+        artifactory.upload_stream(get_blob_path(group_id, sha256, compression), __read_compressed(path, compression, level))
+
+    with trace('upload snapshot blobs', 'remote_cache', count=len(missing)), ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(upload_blob, missing.items()))
+
+    # Manifest goes last, so a snapshot is never visible before all its blobs
+    manifest_data = json.dumps(manifest, indent=1).encode('utf-8')
+    return artifactory.upload_stream(manifest_path, [manifest_data])
+
+
+def __download_blob(artifactory:ArtifactoryInstance, group_id:str, file:dict, compression:str, target_path:str):
+    decompressor = create_decompressor(compression)
+    hasher = hashlib.sha256()
+
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+
+    with open(target_path, 'wb') as f:
+        for chunk in artifactory.get_stream(get_blob_path(group_id, file['sha256'], compression)):
+            data = decompressor.decompress(chunk)
+            hasher.update(data)
+            f.write(data)
+
+    if hasher.hexdigest() != file['sha256']:
+        raise RuntimeError(f"Checksum mismatch for {file['path']}")
+
+    os.chmod(target_path, file['mode'])
+
+
+def restore_snapshot(artifactory:ArtifactoryInstance, group_id:str, manifest_path:str, target_dir:str, jobs:int=8, path_filter:callable=None, root:str=None):
+    '''
+    Recreates the snapshot files in the target directory. Only files accepted by the filter are restored.
+    With `root` only the files inside it are restored, relative to it
+    '''
+    manifest = json.loads(b''.join(artifactory.get_stream(manifest_path)))
+    compression = manifest['compression']
+
+    root_prefix = f'{root}/' if root else ''
+
+    def get_target_path(path:str):
+        if not path.startswith(root_prefix) or (path_filter and not path_filter(path)):
+            return None
+        return os.path.join(target_dir, path[len(root_prefix):])
+
+    for directory in manifest['dirs']:
+        if directory_path := get_target_path(directory):
+            os.makedirs(directory_path, exist_ok=True)
+
+    files = [(file, target_path) for file in manifest['files'] if (target_path := get_target_path(file['path']))]
+
+    def download(item:tuple[dict, str]):
+        __download_blob(artifactory, group_id, item[0], compression, item[1])
+
+    with trace('download snapshot blobs', 'remote_cache', count=len(files)), ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(download, files))
+
+    for link in manifest['links']:
+        if link_path := get_target_path(link['path']):
+            os.makedirs(os.path.dirname(link_path), exist_ok=True)
+            if os.path.lexists(link_path):
+                os.unlink(link_path)
+            os.symlink(link['target'], link_path)
+
+    return manifest
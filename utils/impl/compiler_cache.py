@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from impl.config import directories
+
+# Compilers called by name by the build systems, ccache finds the real ones later in PATH
+masquerade_compilers = ['cc', 'c++', 'gcc', 'g++', 'clang', 'clang++']
+
+launcher_languages = ['C', 'CXX', 'OBJC', 'OBJCXX']
+
+
+class CompilerCache:
+    def __init__(self, cache_dir:str, tool:str=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.tool = tool or ('ccache' if shutil.which('ccache') else 'sccache')
+        self.executable = shutil.which(self.tool)
+
+        if not self.executable:
+            raise RuntimeError(f'Compiler cache `{self.tool}` was not found in PATH')
+
+    @property
+    def uses_masquerade(self):
+        # Symlinks cover CMake, autotools, meson and gn (crashpad), which all call compilers by name.
+        # sccache does not support masquerading and symlinks are not usable on Windows
+        return self.tool == 'ccache' and sys.platform.lower() != 'win32'
+
+    def __create_masquerade_dir(self):
+        masquerade_dir = os.path.join(directories.temp_dir, 'ccache-bin')
+        os.makedirs(masquerade_dir, exist_ok=True)
+
+        for compiler in masquerade_compilers:
+            link_path = os.path.join(masquerade_dir, compiler)
+            if not os.path.lexists(link_path):
+                os.symlink(self.executable, link_path)
+
+        return masquerade_dir
+
+    def activate(self):
+        '''
+        Sets up the environment inherited by the Conan processes building the packages
+        '''
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        if self.tool == 'ccache':
+            os.environ['CCACHE_DIR'] = self.cache_dir
+            # Sources and builds are in different folders on every machine
+            os.environ['CCACHE_BASEDIR'] = os.path.commonpath([directories.recipes_dir, os.path.abspath(directories.build_dir)])
+        else:
+            os.environ['SCCACHE_DIR'] = self.cache_dir
+
+        if self.uses_masquerade:
+            os.environ['PATH'] = self.__create_masquerade_dir() + os.pathsep + os.environ.get('PATH', '')
+        else:
+            # Supported by CMake 3.17+ with Ninja and Makefile generators
+            for language in launcher_languages:
+                os.environ[f'CMAKE_{language}_COMPILER_LAUNCHER'] = self.executable
+
+        print(f'Using {self.tool} compiler cache in `{self.cache_dir}`', flush=True)
+
+    def __get_ccache_stats(self):
+        output = subprocess.check_output([self.executable, '--print-stats']).decode('utf-8')
+        stats = {}
+
+        for line in output.splitlines():
+            key, _, value = line.partition('\t')
+            if value.strip().isdigit():
+                stats[key] = int(value)
+
+        hits = stats.get('direct_cache_hit', 0) + stats.get('preprocessed_cache_hit', 0)
+        return hits, stats.get('cache_miss', 0)
+
+    def __get_sccache_stats(self):
+        output = subprocess.check_output([self.executable, '--show-stats', '--stats-format', 'json']).decode('utf-8')
+        stats = json.loads(output)['stats']
+
+        hits = sum(stats.get('cache_hits', {}).get('counts', {}).values())
+        misses = sum(stats.get('cache_misses', {}).get('counts', {}).values())
+        return hits, misses
+
+    def get_stats(self) -> tuple[int, int]:
+        '''
+        Returns the total number of cache hits and misses, or None if the statistics are not available
+        '''
+        try:
+            if self.tool == 'ccache':
+                return self.__get_ccache_stats()
+            return self.__get_sccache_stats()
+        except (subprocess.CalledProcessError, OSError, ValueError, KeyError) as e:
+            print(f'Failed to get {self.tool} statistics: {e}', flush=True)
+            return None
+
+
+__compiler_cache = None
+
+
+def enable_compiler_cache(cache_dir:str, tool:str=None):
+    global __compiler_cache
+    __compiler_cache = CompilerCache(cache_dir, tool)
+    __compiler_cache.activate()
+
+
+def get_compiler_cache() -> CompilerCache:
+    return __compiler_cache
+
+
+def format_cache_stats(before:tuple[int, int], after:tuple[int, int]):
+    hits = after[0] - before[0]
+    misses = after[1] - before[1]
+    total = hits + misses
+
+    if total == 0:
+        return 'no cacheable compilations'
+
+    return f'{hits} hits, {misses} misses ({hits * 100 / total:.0f}% hit rate)'
@@ -0,0 +1,75 @@
+import bz2
+import lzma
+import zlib
+
+
+def import_zstandard():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        raise RuntimeError('zst compression requires `zstandard` package, install it with `pip install zstandard`')
+
+
+class __NoCompression:
+    def compress(self, data:bytes) -> bytes:
+        return data
+
+    def decompress(self, data:bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b''
+
+
+# Compressions of the stored archives, `none` stores plain tar files
+supported_compressions = ('gz', 'bz2', 'xz', 'zst', 'none')
+
+
+def get_file_suffix(compression:str) -> str:
+    return f'.{compression}' if compression != 'none' else ''
+
+
+def get_compression(file_name:str) -> str:
+    '''
+    Returns the compression of the file from its suffix
+    '''
+    suffix = file_name.rpartition('.')[2]
+    return suffix if suffix in supported_compressions else 'none'
+
+
+def create_compressor(compression:str, level:int=None):
+    '''
+    Returns an incremental compressor with `compress(data)` and `flush()` methods
+    '''
+    if compression == 'zst':
+        # Negative thread count uses all logical CPUs
+        return import_zstandard().ZstdCompressor(level=level if level is not None else 3, threads=-1).compressobj()
+    elif compression == 'gz':
+        return zlib.compressobj(level if level is not None else 9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == 'bz2':
+        return bz2.BZ2Compressor(level if level is not None else 9)
+    elif compression == 'xz':
+        return lzma.LZMACompressor(preset=level)
+    elif compression == 'none':
+        return __NoCompression()
+
+    raise RuntimeError(f'Unsupported compression: {compression}')
+
+
+def create_decompressor(compression:str):
+    '''
+    Returns an incremental decompressor with `decompress(data)` method
+    '''
+    if compression == 'zst':
+        return import_zstandard().ZstdDecompressor().decompressobj()
+    elif compression == 'gz':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    elif compression == 'xz':
+        return lzma.LZMADecompressor()
+    elif compression == 'none':
+        return __NoCompression()
+
+    raise RuntimeError(f'Unsupported compression: {compression}')
@@ -1,25 +1,106 @@
+import ast
 import json
 import os
 import subprocess
+import sys
+import time
 import yaml
 
-from impl import utils
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from impl import conan_backend
 from impl.conan_recipe_store import get_recipe, get_recipe_stores
 from impl.config import directories
 from impl.package_reference import PackageReference
-from impl.profiles import ConanProfiles
+from impl.profiles import ConanProfiles, get_profile_conf
 from impl.debug import handle_build_completed
 from impl import conan_cache
+from impl.build_graph import get_dependency_graph
+from impl.build_state import BuildState, compute_input_hash
+from impl.build_history import record_build, get_expected_durations, get_expected_disk_usage, get_expected_peak_rss
+from impl.build_analysis import analyze_build_order, get_build_waves
+from impl.build_order import write_build_order
+from impl.resource_usage import ResourceUsage, track_resource_usage, record_disk_usage
+from impl.scheduler import run_build_order
+from impl.source_prefetch import SourcePrefetcher
+from impl.tracing import trace
+from impl.files import wait_for_free_space, get_tree_size
+from impl.disk_budget import DiskBudget
+from impl.memory_planner import MemoryPlanner, get_memory_profile
+from impl.compiler_cache import get_compiler_cache, format_cache_stats
+from impl.package_config_provider import package_config_provider
+
+
+def execute_conan_command(command:str, all:bool, build_order:list[str], jobs:int=1):
+    if jobs <= 1:
+        for recipe_store in get_recipe_stores(build_order, not all):
+            recipe_store.execute_command(command, all)
+        return
+
+    recipes = {}
+    for recipe_store in get_recipe_stores(build_order, not all):
+        for recipe in (recipe_store.get_recipes() if all else [recipe_store.get_default_recipe()]):
+            recipes.setdefault(str(recipe.reference), recipe)
 
+    print(f'Running `{command}` for {len(recipes)} recipes using {jobs} workers...', flush=True)
 
-def execute_conan_command(command:str, all:bool, build_order:list[str]):
-    for recipe_store in get_recipe_stores(build_order, not all):
-        recipe_store.execute_command(command, all)
+    failures = {}
+
+    # Recipes used through `python_requires` must be in the cache before the recipes using them are loaded
+    python_requires = { reference: recipe for reference, recipe in recipes.items() if recipe.is_python_require }
+    others = { reference: recipe for reference, recipe in recipes.items() if not recipe.is_python_require }
+
+    # Output is captured per recipe, so the logs of recipes processed at the same time are not mixed
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for phase in (python_requires, others):
+            futures = { executor.submit(recipe.execute_command, command, True): reference for reference, recipe in phase.items() }
+
+            for future in as_completed(futures):
+                reference = futures[future]
+                try:
+                    output = future.result()
+                    print(f'== `{reference}` done\n{output}', flush=True)
+                except subprocess.CalledProcessError as e:
+                    failures[reference] = e.output or str(e)
+                except Exception as e:
+                    failures[reference] = str(e)
+
+    if len(failures) > 0:
+        for reference, output in failures.items():
+            print(f'== `{reference}` failed\n{output}', flush=True)
+
+        print(f'`{command}` failed for: {", ".join(sorted(failures.keys()))}', flush=True)
+        raise Exception(f'`{command}` failed for {len(failures)} of {len(recipes)} recipes')
+
+
+def __get_local_folders(recipe) -> list[str]:
+    '''
+    Source and build folders used only by the package. The build folder shared by sequential builds is excluded
+    '''
+    build_dirs = [path for path in recipe.local_build_dirs if directories.isolate_package_builds or path != recipe.output_dir]
+    return [recipe.local_source_dir] + build_dirs
+
+
+def build_package(package_reference:PackageReference, profiles: ConanProfiles, remotes:list[str] = None, export_recipe:bool=False, keep_sources:bool=False, lockfile:str=None, sources_prefetched:bool=False, conf:dict[str, str] = None) -> ResourceUsage:
+    '''
+    Builds the package and records the build in the build history. Returns the resource usage of the build
+    '''
+    with trace('build_package', 'package', reference=package_reference), track_resource_usage() as usage:
+        start_time = time.monotonic()
+        __build_package(package_reference, profiles, remotes, export_recipe, keep_sources, lockfile, sources_prefetched, conf)
+
+    record_build(package_reference.name, package_reference.version, profiles, time.monotonic() - start_time, usage.peak_rss, usage.cpu_time, usage.disk_usage)
+
+    return usage
 
 
-def build_package(package_reference:PackageReference, profiles: ConanProfiles, remotes:list[str] = None, export_recipe:bool=False, keep_sources:bool=False):
+def __build_package(package_reference:PackageReference, profiles: ConanProfiles, remotes:list[str], export_recipe:bool, keep_sources:bool, lockfile:str, sources_prefetched:bool, conf:dict[str, str]):
     recipe = get_recipe(package_reference)
 
+    # Sources are retrieved to the recipe folder, build output goes to the build folder
+    wait_for_free_space(recipe.recipe_dir)
+    wait_for_free_space(recipe.output_dir)
+
     retrieve_sources = False
 
     try:
@@ -32,25 +113,187 @@ def build_package(package_reference:PackageReference, profiles: ConanProfiles, r
         if retrieve_sources:
             recipe.source()
 
-        recipe.build(profiles, remotes)
+        recipe.build(profiles, remotes, lockfile, conf)
     finally:
-        conan_cache.clean_cache(package_reference, sources=retrieve_sources and not keep_sources)
+        record_disk_usage(sum(get_tree_size(path) for path in __get_local_folders(recipe) + conan_cache.get_package_folders(package_reference)))
+        conan_cache.clean_cache(package_reference, sources=(retrieve_sources or sources_prefetched) and not keep_sources)
+
+
+def __get_link_pool_variables(recipe, profiles:ConanProfiles) -> dict:
+    '''
+    Returns `extra_variables` of CMakeToolchain from the profile if the package is built
+    by CMake with Ninja generator, None if a link job pool can't be used
+    '''
+    if not recipe.uses_cmake_toolchain:
+        return None
+
+    profile_conf = get_profile_conf(profiles.get_profile(recipe.is_build_tool))
+
+    if not recipe.uses_ninja_generator and profile_conf.get('tools.cmake.cmaketoolchain:generator', None) != 'Ninja':
+        return None
+
+    extra_variables = profile_conf.get('tools.cmake.cmaketoolchain:extra_variables', None)
+    if not extra_variables:
+        return {}
+
+    try:
+        extra_variables = ast.literal_eval(extra_variables)
+    except (ValueError, SyntaxError):
+        return None
+
+    return extra_variables if isinstance(extra_variables, dict) else None
+
+
+def get_build_order_dependencies(build_order:list[str], profiles:ConanProfiles, remotes:list[str], jobs:int, resolve_graph:bool=False):
+    if jobs <= 1 and not resolve_graph:
+        # Sequential processing keeps the order from the build order file
+        return {package_name: set(build_order[:index]) for index, package_name in enumerate(build_order)}
+
+    return get_dependency_graph(build_order, profiles, remotes, jobs)
+
+
+def build_all(build_order:list[str], profiles:ConanProfiles, remotes:list[str] = None, export_recipes:bool=False, keep_sources:bool=False, jobs:int=1, lockfile:str=None, incremental:bool=False, journal=None, prefetch_sources:int=0, downloads_per_host:int=2, disk_budget:int=0, memory_aware_jobs:bool=False):
+    if jobs > 1:
+        # Packages built at the same time can't share the output folder
+        directories.isolate_package_builds = True
+
+    if export_recipes and (jobs > 1 or incremental or prefetch_sources > 0):
+        # Dependency graph can only be resolved and sources prefetched once all recipes are in the cache
+        for package_name in build_order:
+            get_recipe(PackageReference(package_name=package_name)).export()
+        export_recipes = False
 
+    dependencies = get_build_order_dependencies(build_order, profiles, remotes, jobs, resolve_graph=incremental)
 
-def build_all(build_order:list[str], profiles:ConanProfiles, remotes:list[str] = None, export_recipes:bool=False, keep_sources:bool=False):
-    for package_name in build_order:
-        build_package(PackageReference(package_name=package_name), profiles, remotes, export_recipes, keep_sources)
+    build_state = BuildState() if incremental else None
+    input_hashes = {}
+
+    def compute_completed_hash(package_name:str):
+        if package_name not in input_hashes:
+            dependency_hashes = { name: compute_completed_hash(name) for name in dependencies[package_name] }
+            input_hashes[package_name] = compute_input_hash(get_recipe(PackageReference(package_name=package_name)), profiles, dependency_hashes)
+        return input_hashes[package_name]
+
+    if build_state and journal:
+        # Packages completed before resuming are not scheduled, but their dependents need their hashes
+        for package_name in build_order:
+            if package_name in journal.completed:
+                compute_completed_hash(package_name)
+
+    budget = DiskBudget(disk_budget, get_expected_disk_usage(build_order, profiles)) if disk_budget > 0 else None
+    utilizations = {}
+
+    memory_planner = None
+    if memory_aware_jobs:
+        peak_rss = get_expected_peak_rss(build_order, profiles)
+        link_pool_variables = {}
+        for package_name in build_order:
+            extra_variables = __get_link_pool_variables(get_recipe(PackageReference(package_name=package_name)), profiles)
+            if extra_variables is not None:
+                link_pool_variables[package_name] = extra_variables
+
+        memory_planner = MemoryPlanner({
+            package_name: get_memory_profile(package_config_provider.get_package_config(package_name), peak_rss.get(package_name))
+            for package_name in build_order }, link_pool_variables=link_pool_variables)
+
+    prefetcher = None
+    if prefetch_sources > 0:
+        completed = set(journal.completed) if journal else set()
+        prefetcher = SourcePrefetcher([name for name in build_order if name not in completed], prefetch_sources, downloads_per_host)
+
+    def build(package_name:str):
+        package_reference = PackageReference(package_name=package_name)
+        sources_prefetched = prefetcher.wait(package_name) if prefetcher else False
+
+        if build_state:
+            recipe = get_recipe(package_reference)
+            input_hash = compute_input_hash(recipe, profiles, { name: input_hashes[name] for name in dependencies[package_name] })
+            input_hashes[package_name] = input_hash
+
+            if build_state.get_hash(recipe, profiles) == input_hash and recipe.has_binary(profiles, remotes):
+                print(f'Skipping `{package_reference}`: inputs did not change since the last build', flush=True)
+                if sources_prefetched and not keep_sources:
+                    conan_cache.clean_cache(package_reference, sources=True)
+                return
+
+        # Memory is reserved by the scheduler before the package is started
+        conf = memory_planner.get_conf(package_name) if memory_planner else None
+
+        # Statistics are global, so builds running at the same time are counted together
+        compiler_cache = get_compiler_cache()
+        cache_stats = compiler_cache.get_stats() if compiler_cache else None
+
+        usage = build_package(package_reference, profiles, remotes, export_recipes, keep_sources, lockfile, sources_prefetched, conf)
+
+        if cache_stats:
+            cache_stats_after = compiler_cache.get_stats()
+            if cache_stats_after:
+                print(f'{package_name}: compiler cache {format_cache_stats(cache_stats, cache_stats_after)}', flush=True)
+
+        summary = usage.get_summary()
+        if summary:
+            print(f'{package_name}: {summary}', flush=True)
+            utilizations[package_name] = (usage.average_cpu_utilization, summary)
+
+        if budget:
+            recipe = get_recipe(package_reference)
+            budget.retain(package_name, __get_local_folders(recipe), conan_cache.get_package_folders(package_reference))
+
+        if build_state:
+            build_state.set_hash(recipe, profiles, input_hash)
+
+    try:
+        run_build_order(build_order, dependencies, build, jobs, journal, get_expected_durations(build_order, profiles), budget, memory_planner)
+    finally:
+        if prefetcher:
+            prefetcher.shutdown(keep_sources)
+
+        if utilizations:
+            # Lowest utilization first, these packages likely do not build in parallel
+            print('Resource usage of the built packages:', flush=True)
+            for package_name, (_, summary) in sorted(utilizations.items(), key=lambda item: item[1][0]):
+                print(f'  {package_name}: {summary}', flush=True)
 
 
 def clean():
-    subprocess.check_call([utils.get_conan(), 'cache', 'clean', '*'])
-    subprocess.check_call([utils.get_conan(), 'remove', '--confirm', '*'])
+    conan_backend.call(['cache', 'clean', '*'])
+    conan_backend.call(['remove', '--confirm', '*'])
+
+
+def __handle_installed_graph(install_output:str):
+    dependecies_graph = json.loads(install_output)['graph']['nodes']
+
+    package_ids = [(node['ref'], node['package_id']) for node in dependecies_graph.values() if node['id'] != '0']
+
+    print(f'Collecting directories for {len(package_ids)} packages')
+    with trace('get_cache_paths', 'cache', packages=len(package_ids)):
+        cache_paths = conan_cache.get_cache_paths(package_ids)
+
+    for ref, package_id in package_ids:
+        try:
+            source_dir, build_dir = cache_paths[(ref, package_id)]
+
+            if not build_dir:
+                print(f'No build directory found for {ref}:{package_id}')
+                continue
+
+            handle_build_completed(PackageReference(package_reference=ref), source_dir, build_dir)
+        except Exception as e:
+            print(f'Failed to collect directories for {ref}:{package_id}: {e}')
+
+
+def __clean_installed_packages(keep_sources:bool):
+    print('Cleaning cache...')
+    if not keep_sources:
+        conan_backend.call(['cache', 'clean', '*'])
+    else:
+        conan_backend.call(['cache', 'clean', '*', '--temp', '--build', '--download'])
 
 
 def install_recipe(recipe_path:str, config_path:str, profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool):
     try:
         cmd = [
-            utils.get_conan(), 'install',
+            'install',
             '-of', directories.install_dir,
             '-vvv',
             '-pr:h', profiles.host_profile,
@@ -79,7 +322,7 @@ def install_recipe(recipe_path:str, config_path:str, profiles:ConanProfiles, rem
         cmd += [recipe_path]
         print(cmd, flush=True)
 
-        output = subprocess.check_output(cmd).decode('utf-8')
+        output = conan_backend.output(cmd)
 
         print("Output from conan install:")
         print(output, flush=True)
@@ -88,33 +331,17 @@ def install_recipe(recipe_path:str, config_path:str, profiles:ConanProfiles, rem
             print("Empty output, failed to collect dependencies")
             return
 
-        dependecies_graph = json.loads(output)['graph']['nodes']
-
-        for node in dependecies_graph.values():
-            if node['id'] == '0':
-                continue
-
-            ref = node['ref']
-            package_id = node['package_id']
+        __handle_installed_graph(output)
+    finally:
+        __clean_installed_packages(keep_sources)
 
-            print(f'Collecting directories for {ref}:{package_id}')
 
-            try:
-                source_dir = subprocess.check_output([utils.get_conan(), 'cache', 'path', '--folder', 'source', ref]).decode('utf-8').strip()
-                build_dir = subprocess.check_output([utils.get_conan(), 'cache', 'path', '--folder', 'build', f'{ref}:{package_id}']).decode('utf-8').strip()
+def install_package(package_reference:PackageReference, profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool):
+    with trace('install_package', 'package', reference=package_reference):
+        __install_package(package_reference, profiles, remotes, allow_build, keep_sources)
 
-                handle_build_completed(PackageReference(package_reference=ref), source_dir, build_dir)
-            except Exception as e:
-                print(f'Failed to collect directories for {ref}:{package_id}: {e}')
 
-    finally:
-        print('Cleaning cache...')
-        if not keep_sources:
-            subprocess.check_call([utils.get_conan(), 'cache', 'clean', '*'])
-        else:
-            subprocess.check_call([utils.get_conan(), 'cache', 'clean', '*', '--temp', '--build', '--download'])
-
-def install_package(package_reference:PackageReference, profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool):
+def __install_package(package_reference:PackageReference, profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool):
     recipe = get_recipe(package_reference)
 
     try:
@@ -126,14 +353,78 @@ def install_package(package_reference:PackageReference, profiles:ConanProfiles,
         conan_cache.clean_cache(package_reference, sources=not keep_sources)
 
 
-def install_all(build_order:list[str], profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool):
-    for package_name in build_order:
+def install_all(build_order:list[str], profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool, jobs:int=1, journal=None):
+    if jobs > 1:
+        directories.isolate_package_builds = True
+
+    def install(package_name:str):
         install_package(PackageReference(package_name=package_name), profiles, remotes, allow_build, keep_sources)
 
+    run_build_order(build_order, get_build_order_dependencies(build_order, profiles, remotes, jobs), install, jobs, journal)
+
+
+def install_all_single_graph(build_order:list[str], profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool, lockfile:str):
+    '''
+    Installs the whole build order as a single graph, writing the lockfile
+    that can be reused by the `build` and `upload` commands
+    '''
+    if os.path.exists(lockfile):
+        os.unlink(lockfile)
+
+    os.makedirs(os.path.dirname(lockfile), exist_ok=True)
+
+    recipes = [get_recipe(PackageReference(package_name=package_name)) for package_name in build_order]
 
-def print_build_order(recipe_path:str, config_path:str, profiles:ConanProfiles, remotes:list[str]):
     cmd = [
-        utils.get_conan(), 'graph', 'info',
+        'install',
+        '-of', directories.install_dir,
+        '-vvv',
+        '-pr:h', profiles.host_profile,
+        '-pr:b', profiles.build_profile,
+        '--lockfile-out', lockfile,
+        '--format', 'json'
+    ]
+
+    for recipe in recipes:
+        # Python requires are resolved as part of the packages using them
+        if recipe.is_python_require:
+            continue
+
+        cmd += ['--tool-requires' if recipe.is_build_tool else '--requires', str(recipe.reference)]
+
+        for opt in recipe.get_requires_options():
+            cmd += ['-o:b' if recipe.is_build_tool else '-o:h', opt]
+
+    if allow_build:
+        cmd += ['--build', 'missing']
+
+    if remotes and len(remotes) > 0:
+        for remote in remotes:
+            cmd += ['-r', remote]
+    else:
+        cmd += ['--no-remote']
+
+    print(cmd, flush=True)
+
+    try:
+        try:
+            output = conan_backend.output(cmd)
+        except subprocess.CalledProcessError:
+            print('Failed to install the build order, exporting recipes and retrying...', flush=True)
+            for recipe in recipes:
+                recipe.export()
+            output = conan_backend.output(cmd)
+
+        print(f'Lockfile written to {lockfile}', flush=True)
+
+        __handle_installed_graph(output)
+    finally:
+        __clean_installed_packages(keep_sources)
+
+
+def get_recipe_graph(recipe_path:str, config_path:str, profiles:ConanProfiles, remotes:list[str]) -> dict:
+    cmd = [
+        'graph', 'info',
         '-pr:h', profiles.host_profile,
         '-pr:b', profiles.build_profile,
         '--build="*"',
@@ -158,46 +449,89 @@ def print_build_order(recipe_path:str, config_path:str, profiles:ConanProfiles,
     cmd += [recipe_path]
     print(cmd)
 
-    dependecies_graph = json.loads(subprocess.check_output(cmd))['graph']['nodes']
+    return json.loads(conan_backend.output(cmd))['graph']['nodes']
 
-    build_node_ids = []
-    dep_node_ids = []
 
-    def __update_node_ids(node_ids:list[str], node_id:str):
-        if node_id in node_ids:
-            node_ids.remove(node_id)
-        node_ids.append(node_id)
+def get_graph_dependencies(dependecies_graph:dict) -> dict[str, set[str]]:
+    '''
+    Converts `conan graph info` nodes to package names mapped to the names of their direct dependencies.
+    The consumer recipe is not included
+    '''
+    dependencies = {}
 
+    for node_id, node in dependecies_graph.items():
+        if node_id == '0':
+            continue
 
-    for node in dependecies_graph.values():
-        for depenency_id, dependecy in node['dependencies'].items():
-            if dependecy['build'] == 'True':
-                __update_node_ids(build_node_ids, depenency_id)
-            else:
-                __update_node_ids(dep_node_ids, depenency_id)
+        dependencies.setdefault(node['name'], set()).update(
+            dependecies_graph[dependency_id]['name'] for dependency_id in node['dependencies'].keys())
+        # Packages like wayland use themselves as a build tool
+        dependencies[node['name']].discard(node['name'])
 
-    build_node_ids.reverse()
-    dep_node_ids.reverse()
+    return dependencies
 
-    processed_deps = set()
 
-    deps = []
+def print_build_order(recipe_path:str, config_path:str, profiles:ConanProfiles, remotes:list[str], analyze:bool=False, workers:list[int] = None, waves:bool=False, output_path:str=None, platforms:str=None):
+    dependecies_graph = get_recipe_graph(recipe_path, config_path, profiles, remotes)
 
-    def __fill_deps(node_ids:list[str]):
-        for node_id in node_ids:
-            dep_node = dependecies_graph[node_id]
-            if dep_node['ref'] in processed_deps:
-                continue
-            processed_deps.add(dep_node['ref'])
-            deps.append(f'{dep_node["name"]}/{dep_node["version"]}')
+    dependencies = get_graph_dependencies(dependecies_graph)
+    versions = {}
+    build_context = set()
 
-    __fill_deps(build_node_ids)
-    __fill_deps(dep_node_ids)
+    for node_id, node in dependecies_graph.items():
+        if node_id == '0':
+            continue
 
-    return '\n'.join(deps)
+        versions[node['name']] = node['version']
+
+        if node.get('context') == 'build':
+            build_context.add(node['name'])
+
+        for dependency_id, dependency in node['dependencies'].items():
+            if dependency['build'] == 'True':
+                build_context.add(dependecies_graph[dependency_id]['name'])
+
+    # Build tools only depend on other build tools, so they can go first
+    all_waves = get_build_waves(dependencies)
+    build_waves = [wave for wave in ([name for name in wave if name in build_context] for wave in all_waves) if wave]
+    host_waves = [wave for wave in ([name for name in wave if name not in build_context] for wave in all_waves) if wave]
+
+    if output_path:
+        def local_waves(waves:list[list[str]]):
+            return [[name for name in wave if os.path.isdir(os.path.join(directories.recipes_dir, name))] for wave in waves]
+
+        external = sorted(name for name in dependencies.keys() if not os.path.isdir(os.path.join(directories.recipes_dir, name)))
+        if external:
+            print(f'Packages without a local recipe are not written to the build order: {", ".join(external)}')
+
+        write_build_order(output_path, [
+            ('Build tools', platforms or sys.platform.lower(), local_waves(build_waves)),
+            ('Host packages', platforms or sys.platform.lower(), local_waves(host_waves)),
+        ])
+        print(f'Build order written to {output_path}')
+
+    if waves:
+        lines = []
+        for context, context_waves in (('build', build_waves), ('host', host_waves)):
+            for index, wave in enumerate(context_waves):
+                lines.append(f'Wave {index + 1} ({context}): {", ".join(f"{name}/{versions[name]}" for name in wave)}')
+        result = '\n'.join(lines)
+    else:
+        result = '\n'.join(f'{name}/{versions[name]}' for wave in build_waves + host_waves for name in wave)
+
+    if analyze:
+        analysis = analyze_build_order(dependencies, get_expected_durations(dependencies.keys(), profiles), workers or [2, 4, 8, 16, 32])
+        return result + '\n\n' + analysis
+
+    return result
 
 
 def install_or_build(package_reference:PackageReference, profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool):
+    with trace('install_or_build', 'package', reference=package_reference):
+        __install_or_build(package_reference, profiles, remotes, allow_build, keep_sources)
+
+
+def __install_or_build(package_reference:PackageReference, profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool):
     recipe = get_recipe(package_reference)
 
     try:
@@ -215,6 +549,8 @@ def install_or_build(package_reference:PackageReference, profiles:ConanProfiles,
         conan_cache.clean_cache(package_reference, sources=not keep_sources)
 
 
-def install_or_build_all(build_order:list[str], profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool):
-    for package_name in build_order:
+def install_or_build_all(build_order:list[str], profiles:ConanProfiles, remotes:list[str], allow_build:bool, keep_sources:bool, jobs:int=1, journal=None):
+    def install_or_build_one(package_name:str):
         install_or_build(PackageReference(package_name=package_name), profiles, remotes, allow_build, keep_sources)
+
+    run_build_order(build_order, get_build_order_dependencies(build_order, profiles, remotes, jobs), install_or_build_one, jobs, journal)
@@ -0,0 +1,274 @@
+import contextlib
+import io
+import json
+import os
+import site
+import subprocess
+import sys
+import sysconfig
+import threading
+
+from impl import resource_usage
+from impl.tracing import trace
+from impl.utils import get_conan
+
+
+class SubprocessBackend:
+    name = 'subprocess'
+
+    def call(self, args:list[str]):
+        cmd = [get_conan()] + args
+        with trace(f'conan {args[0]}', 'subprocess', argv=cmd):
+            resource_usage.check_call(cmd)
+
+    def output(self, args:list[str]) -> str:
+        cmd = [get_conan()] + args
+        with trace(f'conan {args[0]}', 'subprocess', argv=cmd):
+            return subprocess.check_output(cmd).decode('utf-8')
+
+    def call_captured(self, args:list[str]) -> str:
+        '''
+        Runs the command in a separate process and returns its combined output, so
+        commands running at the same time do not mix their output
+        '''
+        cmd = [get_conan()] + args
+        with trace(f'conan {args[0]}', 'subprocess', argv=cmd):
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        output = result.stdout.decode('utf-8', errors='replace')
+
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, cmd, output)
+
+        return output
+
+    def cache_path(self, reference:str, folder:str) -> str:
+        cmd = ['cache', 'path', reference]
+
+        if folder != 'export':
+            cmd += ['--folder', folder]
+
+        try:
+            return self.output(cmd).strip()
+        except subprocess.CalledProcessError:
+            return None
+
+    def list_remotes(self) -> list[dict]:
+        return json.loads(self.output(['remote', 'list', '--format', 'json']))
+
+
+class ApiBackend(SubprocessBackend):
+    name = 'api'
+
+    # These commands run the build systems of the recipes or download sources. They stay in a separate
+    # process, so a crash or an environment change in a build does not affect conan-utils,
+    # and several of them can run at the same time
+    isolated_commands = { 'build', 'export-pkg', 'create', 'test', 'source' }
+
+    def __init__(self, home_path:str):
+        from conan import conan_version
+        from conan.api.conan_api import ConanAPI
+        from conan.cli.cli import Cli
+
+        if conan_version.major < 2:
+            raise RuntimeError(f'Conan {conan_version} does not provide the Conan 2 API')
+
+        try:
+            from conan.api.model import RecipeReference, PkgReference
+        except ImportError:
+            from conans.model.recipe_ref import RecipeReference
+            from conans.model.package_ref import PkgReference
+
+        self.conan_version = conan_version
+        self.recipe_reference_type = RecipeReference
+        self.package_reference_type = PkgReference
+
+        self.api = ConanAPI(home_path)
+        self.cli = Cli(self.api)
+
+        # Conan API keeps global state (output level, current directory while running recipe methods)
+        self.lock = threading.RLock()
+
+    def __is_isolated(self, args:list[str]):
+        if args[0] in self.isolated_commands:
+            return True
+
+        # Install can build missing binaries
+        return args[0] == 'install' and '--build' in args
+
+    def __run(self, args:list[str]):
+        try:
+            self.cli.run(args)
+        except Exception as e:
+            # KeyboardInterrupt and SystemExit are not failures of the command
+            print(f'ERROR: {e}', file=sys.stderr, flush=True)
+            raise subprocess.CalledProcessError(1, ['conan'] + args) from e
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+    def call(self, args:list[str]):
+        if self.__is_isolated(args):
+            return super().call(args)
+
+        if args[0] in ('-v', '--version'):
+            print(f'Conan version {self.conan_version}', flush=True)
+            return
+
+        with self.lock, trace(f'conan {args[0]}', 'conan-api', argv=['conan'] + args):
+            self.__run(args)
+
+    def output(self, args:list[str]) -> str:
+        if self.__is_isolated(args):
+            return super().output(args)
+
+        if args[0] in ('-v', '--version'):
+            return f'Conan version {self.conan_version}\n'
+
+        # Formatted output of the commands goes to stdout, messages go to stderr as with the executable
+        stdout = io.StringIO()
+        with self.lock, trace(f'conan {args[0]}', 'conan-api', argv=['conan'] + args), contextlib.redirect_stdout(stdout):
+            self.__run(args)
+
+        return stdout.getvalue()
+
+    def call_captured(self, args:list[str]) -> str:
+        if self.__is_isolated(args):
+            return super().call_captured(args)
+
+        output = io.StringIO()
+        with self.lock, trace(f'conan {args[0]}', 'conan-api', argv=['conan'] + args):
+            try:
+                with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                    self.__run(args)
+            except subprocess.CalledProcessError as e:
+                e.output = output.getvalue()
+                raise
+
+        return output.getvalue()
+
+    def cache_path(self, reference:str, folder:str) -> str:
+        with self.lock, trace('cache path', 'conan-api', reference=reference, folder=folder):
+            try:
+                try:
+                    package_reference = self.package_reference_type.loads(reference)
+                except Exception:
+                    package_reference = None
+
+                if package_reference:
+                    if folder == 'build':
+                        return self.api.cache.build_path(package_reference)
+                    return self.api.cache.package_path(package_reference)
+
+                recipe_reference = self.recipe_reference_type.loads(reference)
+
+                if folder == 'export_source':
+                    return self.api.cache.export_source_path(recipe_reference)
+                elif folder == 'source':
+                    return self.api.cache.source_path(recipe_reference)
+                return self.api.cache.export_path(recipe_reference)
+            except Exception:
+                return None
+
+    def list_remotes(self) -> list[dict]:
+        with self.lock:
+            return [{
+                'name': remote.name,
+                'url': remote.url,
+                'verify_ssl': remote.verify_ssl,
+                'enabled': not remote.disabled
+            } for remote in self.api.remotes.list()]
+
+
+__backend_type = ApiBackend.name
+__backends = {}
+__backends_lock = threading.Lock()
+
+
+def set_backend_type(backend_type:str):
+    global __backend_type
+    __backend_type = backend_type
+
+
+# Top-level modules of the requirements of Conan 2
+conan_requirement_modules = ('requests', 'urllib3', 'yaml', 'jinja2', 'dateutil', 'colorama', 'distro', 'fasteners', 'patch_ng', 'tqdm')
+
+
+def __add_conan_env_to_path():
+    env_path = os.environ.get('VIRTUAL_ENV', None)
+    if not env_path:
+        return
+
+    # Packages from the Conan environment can only be loaded by the same Python version
+    env_config_path = os.path.join(env_path, 'pyvenv.cfg')
+    if os.path.exists(env_config_path):
+        with open(env_config_path, 'r') as f:
+            for line in f:
+                key, _, value = line.partition('=')
+                if key.strip() in ('version', 'version_info'):
+                    if value.strip().split('.')[:2] != [str(sys.version_info.major), str(sys.version_info.minor)]:
+                        raise RuntimeError(f'Conan environment uses Python {value.strip()}')
+
+    site_packages = sysconfig.get_path('purelib', vars={ 'base': env_path, 'platbase': env_path })
+    if not os.path.isdir(site_packages):
+        return
+
+    # Requirements already imported by conan-utils can't be replaced by the environment copies
+    for module_name in conan_requirement_modules:
+        module = sys.modules.get(module_name, None)
+        module_file = getattr(module, '__file__', None)
+        if not module_file:
+            continue
+
+        has_env_copy = os.path.exists(os.path.join(site_packages, module_name)) or os.path.exists(os.path.join(site_packages, f'{module_name}.py'))
+        if has_env_copy and not os.path.realpath(module_file).startswith(os.path.realpath(site_packages) + os.sep):
+            raise RuntimeError(f'{module_name} is already loaded from {os.path.dirname(module_file)}')
+
+    if site_packages not in sys.path:
+        # addsitedir appends the directory and the paths from its .pth files, they have to win over
+        # the packages of the host Python, so Conan gets the versions of its requirements it was installed with
+        previous_path = list(sys.path)
+        site.addsitedir(site_packages)
+        added_paths = [path for path in sys.path if path not in previous_path]
+        sys.path[:] = added_paths + previous_path
+
+
+def __create_backend(home_path:str):
+    if __backend_type == ApiBackend.name:
+        try:
+            __add_conan_env_to_path()
+            return ApiBackend(home_path)
+        except Exception as e:
+            print(f'Conan API is not available, using Conan executable instead: {e}', flush=True)
+
+    return SubprocessBackend()
+
+
+def get_backend():
+    home_path = os.environ.get('CONAN_HOME', None)
+
+    with __backends_lock:
+        key = (__backend_type, home_path)
+        if key not in __backends:
+            __backends[key] = __create_backend(home_path)
+        return __backends[key]
+
+
+def call(args:list[str]):
+    get_backend().call(args)
+
+
+def output(args:list[str]) -> str:
+    return get_backend().output(args)
+
+
+def call_captured(args:list[str]) -> str:
+    return get_backend().call_captured(args)
+
+
+def cache_path(reference:str, folder:str) -> str:
+    return get_backend().cache_path(reference, folder)
+
+
+def list_remotes() -> list[dict]:
+    return get_backend().list_remotes()
@@ -1,22 +1,16 @@
-import subprocess
 import os
+import sqlite3
 
-from impl import utils
+from impl import conan_backend
 from impl import conan_recipe_store
+from impl.conan_env import get_conan_home_path
 from impl.package_reference import PackageReference
-from impl.files import safe_rm_tree
+from impl.files import remove_tree_async
+from impl.tracing import trace
 
 
 def get_cache_path(folder, package_reference:PackageReference):
-    try:
-        cmd = [utils.get_conan(), 'cache', 'path', str(package_reference)]
-
-        if folder != "export":
-            cmd += ['--folder', folder]
-
-        return subprocess.check_output(cmd).decode('utf-8').strip()
-    except subprocess.CalledProcessError:
-        return None
+    return conan_backend.cache_path(str(package_reference), folder)
 
 
 def get_cache_path_export(package_reference:PackageReference):
@@ -36,11 +30,107 @@ def get_cache_path_source(package_reference:PackageReference):
     return conan_recipe_store.get_recipe(package_reference).local_source_dir
 
 
+def __split_revision(reference:str):
+    reference, _, revision = reference.partition('#')
+    return reference, revision.split('%')[0] if revision else None
+
+
+def __read_cache_db(db_path:str):
+    con = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+
+    try:
+        # Rows are sorted by timestamp, so the latest revision wins
+        recipes = {}
+        for reference, rrev, path in con.execute('SELECT reference, rrev, path FROM recipes ORDER BY timestamp'):
+            recipes[(reference, None)] = path
+            recipes[(reference, rrev)] = path
+
+        packages = {}
+        for reference, rrev, pkgid, path in con.execute('SELECT reference, rrev, pkgid, path FROM packages ORDER BY timestamp'):
+            packages[(reference, None, pkgid)] = path
+            packages[(reference, rrev, pkgid)] = path
+
+        return recipes, packages
+    finally:
+        con.close()
+
+
+def get_package_folders(package_reference:PackageReference) -> list[str]:
+    '''
+    Package folders of the latest recipe revision in the Conan cache
+    '''
+    storage_dir = os.path.join(get_conan_home_path(), 'p')
+    db_path = os.path.join(storage_dir, 'cache.sqlite3')
+
+    if not os.path.exists(db_path):
+        return []
+
+    reference = str(package_reference)
+
+    try:
+        con = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        try:
+            rows = con.execute(
+                'SELECT path FROM packages WHERE reference = ? AND rrev = (SELECT rrev FROM recipes WHERE reference = ? ORDER BY timestamp DESC LIMIT 1)',
+                (reference, reference)).fetchall()
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        print(f'Failed to read Conan cache database {db_path}: {e}', flush=True)
+        return []
+
+    paths = [os.path.join(storage_dir, path.replace('\\', os.sep).replace('/', os.sep), 'p') for (path,) in rows]
+    return [path for path in paths if os.path.isdir(path)]
+
+
+def get_cache_paths(package_ids:list[tuple[str, str]]) -> dict[tuple[str, str], tuple[str, str]]:
+    '''
+    Resolves source and build folders for a list of (reference, package_id) pairs,
+    reading the Conan cache database once instead of calling `conan cache path` for every package
+    '''
+    storage_dir = os.path.join(get_conan_home_path(), 'p')
+    db_path = os.path.join(storage_dir, 'cache.sqlite3')
+
+    recipes, packages = {}, {}
+
+    if os.path.exists(db_path):
+        try:
+            recipes, packages = __read_cache_db(db_path)
+        except sqlite3.Error as e:
+            print(f'Failed to read Conan cache database {db_path}: {e}', flush=True)
+
+    def to_full_path(relative_path:str, folder:str):
+        path = os.path.join(storage_dir, relative_path.replace('\\', os.sep).replace('/', os.sep), folder)
+        return path if os.path.isdir(path) else None
+
+    result = {}
+
+    for reference, package_id in package_ids:
+        recipe_reference, revision = __split_revision(reference)
+
+        recipe_path = recipes.get((recipe_reference, revision))
+        package_path = packages.get((recipe_reference, revision, package_id))
+
+        if recipe_path and package_path:
+            result[(reference, package_id)] = (to_full_path(recipe_path, 's'), to_full_path(package_path, 'b'))
+        else:
+            result[(reference, package_id)] = (
+                conan_backend.cache_path(reference, 'source'),
+                conan_backend.cache_path(f'{reference}:{package_id}', 'build'))
+
+    return result
+
+
 def clean_cache(package_reference:PackageReference, sources:bool=False, builds:bool=True, downloads:bool=True, temp:bool=True, all:bool=False):
+    with trace('clean_cache', 'cache', reference=package_reference, sources=sources, builds=builds):
+        __clean_cache(package_reference, sources, builds, downloads, temp, all)
+
+
+def __clean_cache(package_reference:PackageReference, sources:bool, builds:bool, downloads:bool, temp:bool, all:bool):
     print(f"Cleaning cache for `{package_reference}`...")
 
     cmd = [
-        utils.get_conan(), 'cache', 'clean',
+        'cache', 'clean',
         str(package_reference),
     ]
 
@@ -57,21 +147,21 @@ def clean_cache(package_reference:PackageReference, sources:bool=False, builds:b
         if temp:
             cmd += ['--temp']
 
-    subprocess.check_call(cmd)
+    conan_backend.call(cmd)
 
     # Running cache clean is not sufficient, as we are in "local" mode
     # Sources are in downloaded to the recipe folder, builds paths are local as well,
-    # we neet to clean them manually
+    # we neet to clean them manually. Folders are removed in background, so the next package does not wait
     if all or sources:
         cache_path = get_cache_path_source(package_reference)
-        safe_rm_tree(cache_path)
+        remove_tree_async(cache_path)
 
     recipe = conan_recipe_store.get_recipe(package_reference)
 
     if all or builds:
         for path in recipe.local_build_dirs:
-            safe_rm_tree(path)
+            remove_tree_async(path)
 
     # Conan provides no way to cleanup test folders
     for path in recipe.local_test_build_dirs:
-        safe_rm_tree(path)
+        remove_tree_async(path)
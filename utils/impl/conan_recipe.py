@@ -1,21 +1,23 @@
 import os
-import subprocess
 import json
+import re
 
+from impl import conan_backend
 from impl.package_config_provider import package_config_provider
 from impl.package_reference import PackageReference
-from impl.utils import get_conan
 from impl.profiles import ConanProfiles
+from impl.recipe_revision import is_recipe_exported
 from impl.config import directories
 from impl.debug import handle_build_completed
+from impl.tracing import trace
 
 
 class ConanRecipe:
-    installed_build_folders = []
-
     def __init__(self, recipe_dir:str, package_reference:PackageReference):
         self.recipe_dir = recipe_dir
         self.reference = package_reference
+        # Build folders of this package in the Conan cache, created by `install`
+        self.installed_build_folders = []
         self.config = package_config_provider.get_package_config(package_reference.name)
 
         if not self.config:
@@ -29,6 +31,25 @@ class ConanRecipe:
     def is_python_require(self):
         return 'python_require' in self.config and self.config['python_require']
 
+    @property
+    def uses_cmake_toolchain(self):
+        return 'CMakeToolchain' in self.__read_conanfile()
+
+    @property
+    def uses_ninja_generator(self):
+        '''
+        Whether the recipe sets the Ninja generator of CMakeToolchain itself
+        '''
+        return re.search(r'CMakeToolchain\([^)]*generator\s*=\s*[\'"]Ninja[\'"]', self.__read_conanfile()) is not None
+
+    def __read_conanfile(self) -> str:
+        conanfile_path = os.path.join(self.recipe_dir, 'conanfile.py')
+        if not os.path.exists(conanfile_path):
+            return ''
+
+        with open(conanfile_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
     @property
     def local_source_dir(self):
         return os.path.join(self.recipe_dir, 'src')
@@ -37,10 +58,18 @@ class ConanRecipe:
     def test_package_dir(self):
         return os.path.join(self.recipe_dir, 'test_package')
 
+    @property
+    def output_dir(self):
+        return directories.get_package_build_dir(self.reference.name)
+
+    @property
+    def install_dir(self):
+        return directories.get_package_install_dir(self.reference.name)
+
     @property
     def local_build_dirs(self):
         return [
-            directories.build_dir,
+            self.output_dir,
             os.path.join(self.recipe_dir, 'build'),
             os.path.join(self.recipe_dir, 'build-debug'),
             os.path.join(self.recipe_dir, 'build-release'),
@@ -58,38 +87,53 @@ class ConanRecipe:
             os.path.join(self.test_package_dir, 'build-minsizerel'),
         ]
 
-    def export(self):
+    def __call(self, cmd:list[str], capture_output:bool):
+        if capture_output:
+            return conan_backend.call_captured(cmd)
+        conan_backend.call(cmd)
+
+    def export(self, capture_output:bool=False):
+        if is_recipe_exported(self.recipe_dir, str(self.reference)):
+            message = f'Recipe `{self.reference}` is up to date in the cache, skipping export'
+            if capture_output:
+                return message + '\n'
+            print(message, flush=True)
+            return
+
         cmd = [
-            get_conan(), 'export', self.recipe_dir,
+            'export', self.recipe_dir,
             '--version', self.reference.version,
             '--user', self.reference.user,
             '--channel', self.reference.channel,
             '--no-remote',
         ]
 
-        subprocess.check_call(cmd)
+        with trace('export', 'recipe', reference=self.reference):
+            return self.__call(cmd, capture_output)
 
-    def source(self):
+    def source(self, capture_output:bool=False):
         cmd = [
-            get_conan(), 'source', self.recipe_dir,
+            'source', self.recipe_dir,
             '--version', self.reference.version,
             '--user', self.reference.user,
             '--channel', self.reference.channel,
         ]
 
-        subprocess.check_call([get_conan(), '--version'])
-        subprocess.check_call(cmd)
+        with trace('source', 'recipe', reference=self.reference):
+            if not capture_output:
+                conan_backend.call(['--version'])
+            return self.__call(cmd, capture_output)
 
-    def __run_build_command(self, cmd:str, profiles:ConanProfiles, remotes:list[str] = None, additional_options:list[str] = None, include_recipe=True, force_build_profile=False):
+    def __run_build_command(self, cmd:str, profiles:ConanProfiles, remotes:list[str] = None, additional_options:list[str] = None, include_recipe=True, force_build_profile=False, lockfile:str=None, conf:dict[str, str] = None):
         cmd = [
-            get_conan(), cmd,
+            cmd,
             '--version', self.reference.version,
             '--user', self.reference.user,
             '--channel', self.reference.channel,
             '-vvv',
             '-pr:h', profiles.get_profile(self.is_build_tool or force_build_profile),
             '-pr:b', profiles.build_profile,
-            '-of', directories.build_dir,
+            '-of', self.output_dir,
         ]
 
         if 'options' in self.config:
@@ -99,6 +143,13 @@ class ConanRecipe:
         if additional_options:
             cmd += additional_options
 
+        for key, value in (conf or {}).items():
+            cmd += ['-c', f'{key}={value}']
+
+        if lockfile:
+            # Partial, as the lockfile only covers the packages from the build order
+            cmd += ['--lockfile', lockfile, '--lockfile-partial']
+
         if remotes and len(remotes) > 0:
             for remote in remotes:
                 cmd += ['-r', remote]
@@ -109,10 +160,11 @@ class ConanRecipe:
             cmd += [self.recipe_dir]
 
         print(cmd)
-        subprocess.check_call(cmd)
+        with trace(cmd[0], 'recipe', reference=self.reference, profile=cmd[cmd.index('-pr:h') + 1]):
+            conan_backend.call(cmd)
 
 
-    def build(self, profiles:ConanProfiles, remotes:list[str] = None):
+    def build(self, profiles:ConanProfiles, remotes:list[str] = None, lockfile:str=None, conf:dict[str, str] = None):
         if self.is_python_require:
             print(f"Skipping build for python_require package `{self.reference}`")
             return
@@ -122,20 +174,20 @@ class ConanRecipe:
 
         if not self.is_build_tool and 'use-both-profiles' in self.config and self.config['use-both-profiles']:
             print(f"Building `{self.reference}` with build profile...", flush=True)
-            self.__run_build_command('build', profiles, additional_options=additional_options, force_build_profile=True, remotes=remotes)
+            self.__run_build_command('build', profiles, additional_options=additional_options, force_build_profile=True, remotes=remotes, lockfile=lockfile, conf=conf)
 
             print(f"== Creating Conan package with build profile...", flush=True)
-            self.__run_build_command('export-pkg', profiles, force_build_profile=True, remotes=remotes)
+            self.__run_build_command('export-pkg', profiles, force_build_profile=True, remotes=remotes, lockfile=lockfile)
 
         print(f"Building `{self.reference}`...", flush=True)
-        self.__run_build_command('build', profiles, additional_options=additional_options, remotes=remotes)
+        self.__run_build_command('build', profiles, additional_options=additional_options, remotes=remotes, lockfile=lockfile, conf=conf)
 
         print(f"== Creating Conan package...", flush=True)
-        self.__run_build_command('export-pkg', profiles)
+        self.__run_build_command('export-pkg', profiles, lockfile=lockfile)
 
         handle_build_completed(self.reference, self.local_source_dir, self.local_build_dirs)
 
-    def __get_package_id(self, install_output:bytes):
+    def __get_package_id(self, install_output:str):
         try:
             nodes = json.loads(install_output)['graph']['nodes']
 
@@ -148,27 +200,17 @@ class ConanRecipe:
             return None
 
     def __get_build_folder(self, package_id:str):
-        try:
-            return subprocess.check_output([
-                get_conan(), 'cache', 'path', f'{self.reference}:{package_id}', '--folder=build'
-                ]).decode('utf-8').strip()
-        except subprocess.CalledProcessError:
-            return None
+        return conan_backend.cache_path(f'{self.reference}:{package_id}', 'build')
 
     def __get_cache_source_folder(self, package_id:str):
-        try:
-            return subprocess.check_output([
-                get_conan(), 'cache', 'path', f'{self.reference}', '--folder=source'
-                ]).decode('utf-8').strip()
-        except subprocess.CalledProcessError:
-            return None
+        return conan_backend.cache_path(f'{self.reference}', 'source')
 
     def install(self, profiles:ConanProfiles, remotes:list[str] = None, build_missing:bool = False):
         print(f"Installing `{self.reference}`...", flush=True)
 
         cmd = [
-            get_conan(), 'install',
-            '-of', directories.install_dir,
+            'install',
+            '-of', self.install_dir,
             '--tool-requires' if self.is_build_tool else '--requires', str(self.reference),
             '-vvv',
             '-pr:h', profiles.host_profile,
@@ -185,11 +227,11 @@ class ConanRecipe:
         else:
             cmd += ['--no-remote']
 
-        if 'options' in self.config:
-            for opt in self.config['options'].split():
-                cmd += ['-o:h', opt.strip()]
+        for opt in self.get_requires_options():
+            cmd += ['-o:h', opt]
 
-        package_id = self.__get_package_id(subprocess.check_output(cmd))
+        with trace('install', 'recipe', reference=self.reference):
+            package_id = self.__get_package_id(conan_backend.output(cmd))
         print(F'Package ID: {package_id}')
         if package_id:
             build_folder = self.__get_build_folder(package_id)
@@ -198,14 +240,99 @@ class ConanRecipe:
                 self.installed_build_folders.append(build_folder)
                 handle_build_completed(self.reference, self.__get_cache_source_folder(package_id), build_folder)
 
-    def execute_command(self, command:str):
+    def get_dependencies(self, profiles:ConanProfiles, remotes:list[str] = None) -> set[str]:
+        cmd = [
+            'graph', 'info', self.recipe_dir,
+            '--version', self.reference.version,
+            '--user', self.reference.user,
+            '--channel', self.reference.channel,
+            '-pr:h', profiles.get_profile(self.is_build_tool),
+            '-pr:b', profiles.build_profile,
+            '--format', 'json'
+        ]
+
+        if remotes and len(remotes) > 0:
+            for remote in remotes:
+                cmd += ['-r', remote]
+        else:
+            cmd += ['--no-remote']
+
+        if 'options' in self.config:
+            for opt in self.config['options'].split():
+                cmd += ['-o:h', opt.strip()]
+
+        nodes = json.loads(conan_backend.output(cmd))['graph']['nodes']
+
+        dependencies = set()
+
+        for node in nodes.values():
+            for python_require in (node.get('python_requires') or {}).keys():
+                dependencies.add(python_require.split('/')[0])
+
+            if node['id'] == '0':
+                continue
+
+            dependencies.add(node['name'])
+
+        dependencies.discard(self.reference.name)
+
+        return dependencies
+
+    def get_requires_options(self) -> list[str]:
+        '''
+        Options of the package config for commands using the package through `--requires`,
+        where `&` refers to the virtual consumer instead of the package itself
+        '''
+        options = []
+
+        for opt in self.config.get('options', '').split():
+            opt = opt.strip()
+            if opt.startswith('&:'):
+                opt = f'{self.reference.name}/*:{opt[2:]}'
+            options.append(opt)
+
+        return options
+
+    def has_binary(self, profiles:ConanProfiles, remotes:list[str] = None) -> bool:
+        cmd = [
+            'graph', 'info',
+            '--requires', str(self.reference),
+            '-pr:h', profiles.get_profile(self.is_build_tool),
+            '-pr:b', profiles.build_profile,
+            '--format', 'json'
+        ]
+
+        if remotes and len(remotes) > 0:
+            for remote in remotes:
+                cmd += ['-r', remote]
+        else:
+            cmd += ['--no-remote']
+
+        for opt in self.get_requires_options():
+            cmd += ['-o:h', opt]
+
+        try:
+            nodes = json.loads(conan_backend.output(cmd))['graph']['nodes']
+        except Exception as e:
+            print(f'Failed to check binary for `{self.reference}`: {e}', flush=True)
+            return False
+
+        for node in nodes.values():
+            if node.get('ref', '').split('#')[0] == str(self.reference):
+                return node.get('binary') in ('Cache', 'Download', 'Update')
+
+        return False
+
+    def execute_command(self, command:str, capture_output:bool=False):
         if command == 'export-recipes':
-            self.export()
+            return self.export(capture_output)
         elif command == 'update-sources':
-            self.source()
+            return self.source(capture_output)
 
-    def upload(self, remote_name:str, with_binaries:bool):
-        args = [get_conan(), 'upload', '--check', '--confirm', '-r', remote_name, str(self.reference)]
+    def upload(self, remote_name:str, with_binaries:bool, revision:str=None):
+        reference = f'{self.reference}#{revision}' if revision else str(self.reference)
+        args = ['upload', '--check', '--confirm', '-r', remote_name, reference]
         if not with_binaries:
             args += ['--only-recipe']
-        subprocess.check_call(args)
+        with trace('upload', 'recipe', reference=reference, remote=remote_name, binaries=with_binaries):
+            conan_backend.call(args)
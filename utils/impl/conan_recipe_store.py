@@ -8,7 +8,7 @@ from impl.conan_recipe import ConanRecipe
 
 class ConanRecipeStore:
     versions = None
-    conan_references = {}
+    conan_references = None
     package_config = None
     default_version = None
 
@@ -27,6 +27,7 @@ class ConanRecipeStore:
         with open(config_path, 'r') as f:
             config = yaml.safe_load(f)
             self.versions = config['versions']
+            self.conan_references = {}
 
             for version in self.versions.keys():
                 self.conan_references[version] = PackageReference(package_name=self.name, package_version=version)
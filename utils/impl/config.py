@@ -19,6 +19,9 @@ class Directories():
 
     install_dir = os.path.join(output_dir, 'install')
 
+    # Set when several packages are built at the same time, so each one gets its own output folder
+    isolate_package_builds = False
+
     @property
     def config_packages_dir(self):
         return os.path.join(self.config_dir, 'packages')
@@ -31,6 +34,16 @@ class Directories():
     def profiles_dir(self):
         return os.path.join(self.config_dir, 'profiles')
 
+    def get_package_build_dir(self, package_name:str):
+        if self.isolate_package_builds:
+            return os.path.join(self.build_dir, package_name)
+        return self.build_dir
+
+    def get_package_install_dir(self, package_name:str):
+        if self.isolate_package_builds:
+            return os.path.join(self.install_dir, package_name)
+        return self.install_dir
+
     def change_output_dir(self, output_dir:str):
         self.output_dir = output_dir
         self.env_dir = os.path.join(output_dir, 'venv')
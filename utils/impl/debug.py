@@ -1,9 +1,12 @@
 import os
+import threading
 
 from impl.package_reference import PackageReference
 from impl.debug_processor import create_debug_processor, load_processors
+from impl.tracing import trace
 
 __debug_processors = []
+__debug_processors_lock = threading.Lock()
 
 def enable_debug_processors(processors:list[str], skip_upload:bool):
     if not processors:
@@ -21,7 +24,8 @@ def enable_debug_processors(processors:list[str], skip_upload:bool):
 
 def finalize_debug_processors():
     for processor in __debug_processors:
-        processor.finalize()
+        with trace('finalize', 'debug', processor=type(processor).__name__):
+            processor.finalize()
 
 def discard_debug_data():
     for processor in __debug_processors:
@@ -45,5 +49,8 @@ def handle_build_completed(package_reference:PackageReference, source_dir: str,
 
     if os.path.isdir(build_dir):
         print(f'Processing debug info for {package_reference} ({source_dir}, {build_dir})')
-        for processor in __debug_processors:
-            processor.process(package_reference, source_dir, build_dir)
+        # Processors are not thread safe and packages can be built concurrently
+        with __debug_processors_lock:
+            for processor in __debug_processors:
+                with trace('process', 'debug', processor=type(processor).__name__, reference=package_reference, build_dir=build_dir):
+                    processor.process(package_reference, source_dir, build_dir)
@@ -0,0 +1,80 @@
+import threading
+
+from impl.files import get_tree_size, remove_tree_async
+
+__gigabyte = 1024 * 1024 * 1024
+
+
+def format_size(size:float):
+    return f'{size / __gigabyte:.1f} GB'
+
+
+class DiskBudget:
+    '''
+    Limits the disk space used by the source, build and package folders of the packages.
+    Running packages reserve their expected usage, finished packages keep the size of their
+    retained folders (e.g. sources with --keep-sources) until they are evicted. Package folders
+    stay in the Conan cache, so they are counted but never evicted
+    '''
+    def __init__(self, limit:int, expected_usage:dict[str, float] = None):
+        self.limit = limit
+        self.expected_usage = { name: usage for name, usage in (expected_usage or {}).items() if usage }
+
+        # Packages without history are assumed to use an average amount of space
+        self.default_usage = sum(self.expected_usage.values()) / len(self.expected_usage) if self.expected_usage else 0
+
+        self.reserved = {}
+        self.retained = {}
+        self.packages = {}
+        self.lock = threading.Lock()
+
+    def __get_used(self):
+        return sum(self.reserved.values()) + sum(size for size, _ in self.retained.values()) + sum(self.packages.values())
+
+    def __evict(self, needed:float):
+        # Largest folders first, so as few packages as possible lose their folders
+        for package_name, (size, paths) in sorted(self.retained.items(), key=lambda item: -item[1][0]):
+            if self.__get_used() + needed <= self.limit:
+                break
+
+            print(f'Disk budget: evicting folders of `{package_name}` ({format_size(size)})', flush=True)
+
+            for path in paths:
+                remove_tree_async(path)
+
+            del self.retained[package_name]
+
+    def try_reserve(self, package_name:str, force:bool=False) -> bool:
+        '''
+        Reserves the expected usage of the package. Returns False if it does not fit the budget even
+        after evicting the retained folders, unless forced (nothing else is running)
+        '''
+        expected = self.expected_usage.get(package_name, self.default_usage)
+
+        with self.lock:
+            if self.__get_used() + expected > self.limit:
+                self.__evict(expected)
+
+            if self.__get_used() + expected > self.limit and not force:
+                return False
+
+            self.reserved[package_name] = expected
+            return True
+
+    def release(self, package_name:str):
+        with self.lock:
+            self.reserved.pop(package_name, None)
+
+    def retain(self, package_name:str, paths:list[str], package_paths:list[str] = None):
+        '''
+        Records the folders left by the finished package
+        '''
+        size = sum(get_tree_size(path) for path in paths)
+        package_size = sum(get_tree_size(path) for path in package_paths or [])
+
+        with self.lock:
+            self.reserved.pop(package_name, None)
+            self.packages[package_name] = package_size
+
+            if size > 0:
+                self.retained[package_name] = (size, paths)
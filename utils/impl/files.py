@@ -1,6 +1,22 @@
 import shutil
+import threading
 import time
 import os
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from impl.config import directories
+from impl.tracing import trace
+
+__removal_executor = None
+__pending_removals = set()
+__trash_dirs = set()
+__scheduled_paths = set()
+__removals_lock = threading.Lock()
+
+# Builds wait for background removals while free space is below this limit
+__min_free_space = 0
 
 def safe_rm_tree(path):
     if not os.path.isdir(path):
@@ -18,9 +34,143 @@ def safe_rm_tree(path):
 
     for i in range(20):
         try:
-            shutil.rmtree(path, onerror=onerror)
+            with trace('safe_rm_tree', 'files', path=path, attempt=i + 1):
+                shutil.rmtree(path, onerror=onerror)
             return
         except Exception as e:
             delay = 0.5 * float(i + 1)
             print(f"Failed to remove `{path}`: `{e}`. Retrying in {delay} seconds...")
-            time.sleep(delay)
+            with trace('safe_rm_tree retry delay', 'files', path=path, delay=delay):
+                time.sleep(delay)
+
+
+def get_trash_dir() -> str:
+    return os.path.join(directories.temp_dir, 'trash')
+
+
+def __schedule_removal(trash_path:str):
+    global __removal_executor
+
+    with __removals_lock:
+        if trash_path in __scheduled_paths:
+            return
+        __scheduled_paths.add(trash_path)
+
+        if not __removal_executor:
+            __removal_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='remove')
+
+        future = __removal_executor.submit(safe_rm_tree, trash_path)
+        __pending_removals.add(future)
+        __trash_dirs.add(os.path.dirname(trash_path))
+
+    future.add_done_callback(__on_removal_done)
+
+
+def remove_tree_async(path:str):
+    '''
+    Moves the directory to the trash folder in the temp directory and removes it in background.
+    Falls back to removing in place if the directory cannot be renamed, e.g. a file is open on Windows
+    or the temp directory is on another volume
+    '''
+    if not os.path.isdir(path):
+        return
+
+    path = os.path.abspath(path)
+    trash_path = os.path.join(get_trash_dir(), f'{os.path.basename(path)}-{uuid.uuid4().hex[:8]}')
+
+    try:
+        os.makedirs(os.path.dirname(trash_path), exist_ok=True)
+        os.rename(path, trash_path)
+    except OSError as e:
+        print(f"Failed to move `{path}` to trash: `{e}`. Removing in place...")
+        safe_rm_tree(path)
+        return
+
+    __schedule_removal(trash_path)
+
+
+def remove_trash_async():
+    '''
+    Removes in background the directories left in the trash by interrupted runs
+    '''
+    trash_dir = get_trash_dir()
+
+    if not os.path.isdir(trash_dir):
+        return
+
+    for entry in os.listdir(trash_dir):
+        __schedule_removal(os.path.join(trash_dir, entry))
+
+
+def __on_removal_done(future):
+    with __removals_lock:
+        __pending_removals.discard(future)
+
+
+def wait_for_removals():
+    with __removals_lock:
+        pending = list(__pending_removals)
+
+    if pending:
+        print(f"Waiting for {len(pending)} directories to be removed...", flush=True)
+
+        with trace('wait_for_removals', 'files', count=len(pending)):
+            wait(pending)
+
+    with __removals_lock:
+        for trash_dir in __trash_dirs:
+            try:
+                os.rmdir(trash_dir)
+            except OSError:
+                pass
+        __trash_dirs.clear()
+
+
+def get_tree_size(path:str) -> int:
+    size = 0
+    stack = [path]
+
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        size += entry.stat(follow_symlinks=False).st_size
+        except OSError:
+            continue
+
+    return size
+
+
+def set_min_free_space(min_free_space:int):
+    global __min_free_space
+    __min_free_space = min_free_space
+
+
+def __get_free_space(path:str):
+    # Directory might not be created yet
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def wait_for_free_space(path:str):
+    '''
+    Waits for background removals until the free space on the disk with the path is above the limit
+    '''
+    if __min_free_space <= 0:
+        return
+
+    with trace('wait_for_free_space', 'files', path=path):
+        while __get_free_space(path) < __min_free_space:
+            with __removals_lock:
+                pending = list(__pending_removals)
+
+            if not pending:
+                print(f"Free space on the disk with `{path}` is below {__min_free_space // (1024 * 1024)} MB, continuing anyway", flush=True)
+                return
+
+            print(f"Free space on the disk with `{path}` is below {__min_free_space // (1024 * 1024)} MB, waiting for {len(pending)} directories to be removed...", flush=True)
+            wait(pending, return_when=FIRST_COMPLETED)
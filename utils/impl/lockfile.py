@@ -0,0 +1,33 @@
+import json
+import os
+
+from impl.config import directories
+
+
+def get_lockfile_path(lockfile:str=None):
+    if not lockfile:
+        return os.path.join(directories.temp_dir, 'build_order.lock')
+    return os.path.abspath(lockfile)
+
+
+def get_locked_revisions(lockfile:str) -> dict[str, str]:
+    '''
+    Returns recipe revisions locked in the lockfile, keyed by the reference without the revision
+    (`name/version@user/channel`). Several versions of a package can be locked at the same time
+    '''
+    if not lockfile or not os.path.exists(lockfile):
+        return {}
+
+    with open(lockfile, 'r') as f:
+        lock = json.load(f)
+
+    revisions = {}
+
+    for section in ('requires', 'build_requires', 'python_requires'):
+        for locked_reference in lock.get(section, []):
+            # name/version@user/channel#revision%timestamp
+            reference, _, revision = locked_reference.partition('#')
+            if revision:
+                revisions[reference] = revision.split('%')[0]
+
+    return revisions
@@ -0,0 +1,114 @@
+import os
+import threading
+
+megabyte = 1024 * 1024
+
+# Used for packages without a declared memory profile or build history
+default_memory_per_job = 1024 * megabyte
+
+
+def get_available_memory() -> int:
+    '''
+    Returns MemAvailable from /proc/meminfo, or None when it is not available
+    '''
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'MemAvailable':
+                    return int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+
+class MemoryProfile:
+    def __init__(self, memory_per_job:int, memory_per_link_job:int):
+        self.memory_per_job = memory_per_job
+        self.memory_per_link_job = memory_per_link_job
+
+
+def get_memory_profile(package_config:dict, peak_rss:float=None) -> MemoryProfile:
+    '''
+    Memory profile declared in the package config (`memory-per-job`, `memory-per-link-job`, in MB)
+    or learned from the build history. Peak RSS of a build is the peak of its largest process,
+    usually the linker, so it is only used for link jobs
+    '''
+    package_config = package_config or {}
+
+    memory_per_job = package_config.get('memory-per-job', None)
+    memory_per_job = int(memory_per_job) * megabyte if memory_per_job else default_memory_per_job
+
+    memory_per_link_job = package_config.get('memory-per-link-job', None)
+    if memory_per_link_job:
+        memory_per_link_job = int(memory_per_link_job) * megabyte
+    else:
+        memory_per_link_job = max(memory_per_job, int(peak_rss) if peak_rss else memory_per_job)
+
+    return MemoryProfile(memory_per_job, memory_per_link_job)
+
+
+class MemoryPlanner:
+    '''
+    Splits the available memory between the packages built at the same time and
+    derives the number of compile and link jobs of each package from its memory profile.
+    Packages wait until the memory for at least one link job is free.
+    Link jobs are limited only for the packages in `link_pool_variables`, mapped to the
+    `extra_variables` of CMakeToolchain they already have (from the profiles)
+    '''
+    def __init__(self, profiles:dict[str, MemoryProfile], cpu_count:int=None, link_pool_variables:dict[str, dict] = None):
+        self.profiles = profiles
+        self.link_pool_variables = link_pool_variables or {}
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        # Measured once: running builds are already accounted for by their reservations
+        self.total_memory = get_available_memory()
+        self.reserved = {}
+        self.confs = {}
+        self.lock = threading.Lock()
+
+    def try_reserve(self, package_name:str, force:bool=False) -> bool:
+        '''
+        Reserves memory for the package. Returns False if not even a single link job fits,
+        unless forced (nothing else is running)
+        '''
+        if not self.total_memory:
+            return True
+
+        profile = self.profiles.get(package_name) or MemoryProfile(default_memory_per_job, default_memory_per_job)
+
+        with self.lock:
+            free = self.total_memory - sum(self.reserved.values())
+
+            if free < max(profile.memory_per_job, profile.memory_per_link_job) and not force:
+                return False
+
+            jobs = max(1, min(self.cpu_count, free // profile.memory_per_job))
+            link_jobs = max(1, min(jobs, free // profile.memory_per_link_job))
+
+            self.reserved[package_name] = max(jobs * profile.memory_per_job, link_jobs * profile.memory_per_link_job)
+
+            self.confs[package_name] = { 'tools.build:jobs': str(jobs) }
+
+            # Link job pool is only supported by CMake with Ninja generator. The value replaces
+            # `extra_variables` set in the profiles, so they are merged into it
+            if package_name in self.link_pool_variables:
+                extra_variables = dict(self.link_pool_variables[package_name])
+                extra_variables.update({ 'CMAKE_JOB_POOLS': f'link_pool={link_jobs}', 'CMAKE_JOB_POOL_LINK': 'link_pool' })
+                self.confs[package_name]['tools.cmake.cmaketoolchain:extra_variables'] = repr(extra_variables)
+
+        print(f'Building `{package_name}` with {jobs} jobs and {link_jobs} link jobs ({max(0, free) // megabyte} MB of memory available)', flush=True)
+
+        return True
+
+    def get_conf(self, package_name:str) -> dict[str, str]:
+        '''
+        Conan configuration limiting the jobs of the package, set when its memory is reserved
+        '''
+        with self.lock:
+            return self.confs.get(package_name, {})
+
+    def release(self, package_name:str):
+        with self.lock:
+            self.reserved.pop(package_name, None)
+            self.confs.pop(package_name, None)
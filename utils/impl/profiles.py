@@ -39,3 +39,52 @@ class ConanProfiles:
         else:
             return self.host_profile
 
+
+
+def get_profile_files(path:str) -> list[str]:
+    '''
+    Returns the profile and the profiles it includes with `include()` relative to it, included profiles first
+    '''
+    files = []
+
+    def add_profile(profile_path:str):
+        profile_path = os.path.realpath(profile_path)
+        if profile_path in files:
+            return
+
+        with open(profile_path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('include(') and line.endswith(')'):
+                    include_path = line[len('include('):-1].strip()
+                    if not os.path.isabs(include_path):
+                        include_path = os.path.join(os.path.dirname(profile_path), include_path)
+
+                    # Profiles from the Conan home and templated paths are not followed
+                    if os.path.isfile(include_path):
+                        add_profile(include_path)
+
+        files.append(profile_path)
+
+    add_profile(path)
+    return files
+
+
+def get_profile_conf(path:str) -> dict[str, str]:
+    '''
+    Returns the [conf] section of the profile, including the profiles it includes
+    '''
+    conf = {}
+
+    for profile_path in get_profile_files(path):
+        section = None
+        with open(profile_path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('[') and line.endswith(']'):
+                    section = line[1:-1]
+                elif section == 'conf' and '=' in line and not line.startswith('#'):
+                    key, _, value = line.partition('=')
+                    conf[key.strip()] = value.strip()
+
+    return conf
@@ -0,0 +1,144 @@
+import ast
+import os
+import yaml
+
+from impl.config import directories
+from impl.package_config_provider import package_config_provider
+
+__requirement_methods = { 'requires', 'tool_requires', 'build_requires' }
+__requirement_attributes = { 'requires', 'tool_requires', 'build_requires', 'python_requires' }
+
+
+def __get_requirement_name(node:ast.AST) -> str:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        reference = node.value
+    elif isinstance(node, ast.JoinedStr) and node.values and isinstance(node.values[0], ast.Constant):
+        # f"zlib/{self._zlib_version}", only the name is needed
+        reference = node.values[0].value
+    else:
+        return None
+
+    if '/' not in reference:
+        return None
+
+    return reference.split('/')[0].strip()
+
+
+def __get_attribute_requirements(node:ast.AST) -> list[str]:
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [__get_requirement_name(element) for element in node.elts]
+    return [__get_requirement_name(node)]
+
+
+def __is_requirement_call(node:ast.AST) -> bool:
+    if not isinstance(node, ast.Call) or not node.args:
+        return False
+
+    function = node.func
+    return isinstance(function, ast.Attribute) and function.attr in __requirement_methods \
+        and isinstance(function.value, ast.Name) and function.value.id == 'self'
+
+
+def __collect_requirements(node:ast.AST, conditional:bool, requirements:list[tuple[str, bool]]):
+    if __is_requirement_call(node):
+        requirements.append((__get_requirement_name(node.args[0]), conditional))
+    elif isinstance(node, ast.ClassDef):
+        for statement in node.body:
+            if isinstance(statement, ast.Assign):
+                for target in statement.targets:
+                    if isinstance(target, ast.Name) and target.id in __requirement_attributes:
+                        requirements += [(name, conditional) for name in __get_attribute_requirements(statement.value)]
+
+    # Requirements inside branches and loops depend on settings, options or the version
+    conditional = conditional or isinstance(node, (ast.If, ast.IfExp, ast.For, ast.While, ast.Try, ast.Match))
+
+    for child in ast.iter_child_nodes(node):
+        __collect_requirements(child, conditional, requirements)
+
+
+def get_conanfile_requirements(conanfile_path:str, include_conditional:bool=True) -> set[str]:
+    '''
+    Returns names of all packages the recipe may require. Conditions are not evaluated,
+    so requirements of every platform and option are included unless `include_conditional` is False
+    '''
+    with open(conanfile_path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=conanfile_path)
+
+    requirements = []
+    __collect_requirements(tree, False, requirements)
+
+    return { name for name, conditional in requirements if name and (include_conditional or not conditional) }
+
+
+def get_recipe_conanfile_path(package_name:str) -> str:
+    recipe_path = os.path.join(directories.recipes_dir, package_name)
+    config_path = os.path.join(recipe_path, 'config.yml')
+
+    if not os.path.exists(config_path):
+        return None
+
+    with open(config_path, 'r') as f:
+        versions = yaml.safe_load(f)['versions']
+
+    package_config = package_config_provider.get_package_config(package_name)
+    version = package_config['version'] if package_config else None
+
+    # Versions without a package config are listed from the newest one
+    if version not in versions:
+        version = next(iter(versions))
+
+    conanfile_path = os.path.join(recipe_path, versions[version]['folder'], 'conanfile.py')
+
+    return conanfile_path if os.path.exists(conanfile_path) else None
+
+
+def get_bundled_package_names() -> list[str]:
+    return sorted(
+        name for name in os.listdir(directories.recipes_dir)
+        if os.path.exists(os.path.join(directories.recipes_dir, name, 'config.yml')))
+
+
+def get_static_dependency_graph(package_names:list[str] = None, include_conditional:bool=True) -> dict[str, set[str]]:
+    '''
+    Approximate dependency graph of the bundled recipes, built without resolving the Conan graph.
+    Requirements of packages without a bundled recipe are kept
+    '''
+    if package_names is None:
+        package_names = get_bundled_package_names()
+
+    dependencies = {}
+
+    for package_name in package_names:
+        conanfile_path = get_recipe_conanfile_path(package_name)
+
+        if not conanfile_path:
+            dependencies[package_name] = set()
+            continue
+
+        try:
+            dependencies[package_name] = get_conanfile_requirements(conanfile_path, include_conditional) - { package_name }
+        except SyntaxError as e:
+            print(f'Failed to parse `{conanfile_path}`: {e}', flush=True)
+            dependencies[package_name] = set()
+
+    return dependencies
+
+
+def get_build_order_violations(build_order:list[str]) -> list[tuple[str, str, bool]]:
+    '''
+    Returns tuples of (package, dependency, conditional) where the package is listed before its dependency.
+    Conditional requirements may not apply to the platform, so they are reported separately.
+    Dependencies not in the build order are ignored, as they are usually required on other platforms only
+    '''
+    positions = { package_name: index for index, package_name in enumerate(build_order) }
+    dependencies = get_static_dependency_graph(build_order)
+    unconditional_dependencies = get_static_dependency_graph(build_order, include_conditional=False)
+
+    violations = []
+
+    for index, package_name in enumerate(build_order):
+        for dependency in sorted(dependencies[package_name]):
+            if positions.get(dependency, -1) > index:
+                violations.append((package_name, dependency, dependency not in unconditional_dependencies[package_name]))
+
+    return violations
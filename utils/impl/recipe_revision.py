@@ -0,0 +1,123 @@
+import hashlib
+import os
+import sqlite3
+
+from impl.conan_env import get_conan_home_path
+
+# Files exported with `exports_sources` and `export_sources()` are listed with this prefix
+__export_source_prefix = 'export_source/'
+
+
+def __md5sum(path:str) -> str:
+    md5 = hashlib.md5()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def get_latest_recipe_revision(reference:str) -> tuple[str, str]:
+    '''
+    Returns the latest revision of the recipe in the cache and the path to its export folder
+    '''
+    storage_dir = os.path.join(get_conan_home_path(), 'p')
+    db_path = os.path.join(storage_dir, 'cache.sqlite3')
+
+    if not os.path.exists(db_path):
+        return None, None
+
+    try:
+        con = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        try:
+            row = con.execute('SELECT rrev, path FROM recipes WHERE reference = ? ORDER BY timestamp DESC LIMIT 1', (reference,)).fetchone()
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        print(f'Failed to read Conan cache database {db_path}: {e}', flush=True)
+        return None, None
+
+    if not row:
+        return None, None
+
+    rrev, path = row
+    return rrev, os.path.join(storage_dir, path.replace('\\', os.sep).replace('/', os.sep), 'e')
+
+
+def read_manifest(manifest_path:str) -> list[str]:
+    '''
+    Returns the files listed in `conanmanifest.txt`. The first line of the manifest is a timestamp
+    '''
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()[1:]
+
+    return [line.rpartition(': ')[0] for line in lines if line]
+
+
+def __get_local_path(recipe_dir:str, file:str) -> str:
+    local_path = file[len(__export_source_prefix):] if file.startswith(__export_source_prefix) else file
+    return os.path.join(recipe_dir, local_path.replace('/', os.sep))
+
+
+def compute_revision(recipe_dir:str, files:list[str]) -> str:
+    '''
+    Computes the revision Conan assigns in `hash` revision mode (md5 of the sorted
+    "file: md5" lines of the manifest) from the local recipe files.
+    Returns None if one of the files does not exist locally
+    '''
+    file_sums = {}
+
+    for file in files:
+        local_path = __get_local_path(recipe_dir, file)
+
+        if not os.path.isfile(local_path):
+            return None
+
+        file_sums[file] = __md5sum(local_path)
+
+    lines = [f'{file}: {md5}' for file, md5 in sorted(file_sums.items())]
+    lines.append('')
+
+    return hashlib.md5('\n'.join(lines).encode('utf-8')).hexdigest()
+
+
+def has_new_files(recipe_dir:str, files:list[str]) -> bool:
+    '''
+    Checks for local files missing from the manifest in the subfolders with exported files,
+    like a new patch in `patches`. The recipe folder itself also contains files that are never exported
+    '''
+    exported_paths = { os.path.normcase(__get_local_path(recipe_dir, file)) for file in files }
+    exported_dirs = { os.path.dirname(path) for path in exported_paths } - { os.path.normcase(recipe_dir) }
+
+    for exported_dir in exported_dirs:
+        for name in os.listdir(exported_dir):
+            path = os.path.normcase(os.path.join(exported_dir, name))
+            if os.path.isfile(path) and path not in exported_paths:
+                return True
+
+    return False
+
+
+def is_recipe_exported(recipe_dir:str, reference:str) -> bool:
+    '''
+    Checks that the latest revision of the recipe in the cache was exported from the local files.
+    New files are only detected in the subfolders that already had exported files, so a new file
+    picked up by an `exports` pattern elsewhere without any other change is not detected
+    '''
+    rrev, export_path = get_latest_recipe_revision(reference)
+
+    if not rrev:
+        return False
+
+    manifest_path = os.path.join(export_path, 'conanmanifest.txt')
+
+    if not os.path.exists(manifest_path):
+        return False
+
+    try:
+        files = read_manifest(manifest_path)
+        return compute_revision(recipe_dir, files) == rrev and not has_new_files(recipe_dir, files)
+    except OSError as e:
+        print(f'Failed to compute revision of `{reference}`: {e}', flush=True)
+        return False
@@ -1,8 +1,17 @@
+import bz2
+import gzip
+import json
+import lzma
 import os
+import queue
 import sys
 import sqlite3
 import tarfile
+import shutil
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
 import yaml
@@ -14,6 +23,9 @@ from impl.conan_env import ConanEnv
 from impl.upload import upload_all
 from impl.debug_processor import create_debug_processor, load_processors
 from impl.build_order import get_build_order
+from impl.tracing import trace
+from impl.compression import import_zstandard, get_compression, create_decompressor, supported_compressions
+from impl.cache_snapshot import snapshot_suffix, upload_snapshot, restore_snapshot
 
 def get_artifactory(remote:str, username:str, password:str, key:str):
     if not remote:
@@ -24,10 +36,169 @@ def get_artifactory(remote:str, username:str, password:str, key:str):
     return ArtifactoryInstance(remote, username=username, password=password, key=key)
 
 
+# Index of the per-package archives, stored instead of the cache archive with `packages` format
+package_index_suffix = '.index.json'
+
+
 def get_cache_file_name(cache_id:str, compression:str='xz'):
     return f'{cache_id}.tar.{compression}' if compression != 'none' else f'{cache_id}.tar'
 
 
+@contextmanager
+def open_tar_for_writing(fileobj, compression:str, level:int=None):
+    '''
+    Opens a stream tar writing compressed data to the file object, so the archive can be written to a pipe.
+    Default levels match the ones used by `tarfile`
+    '''
+    if compression == 'zst':
+        zstandard = import_zstandard()
+        # Negative thread count uses all logical CPUs
+        compressor = zstandard.ZstdCompressor(level=level if level is not None else 3, threads=-1)
+        compressed = compressor.stream_writer(fileobj, closefd=False)
+    elif compression == 'gz':
+        compressed = gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=level if level is not None else 9)
+    elif compression == 'bz2':
+        compressed = bz2.BZ2File(fileobj, 'wb', compresslevel=level if level is not None else 9)
+    elif compression == 'xz':
+        compressed = lzma.LZMAFile(fileobj, 'wb', preset=level)
+    elif compression == 'none':
+        compressed = None
+    else:
+        raise RuntimeError(f'Unsupported compression: {compression}')
+
+    try:
+        with tarfile.open(fileobj=compressed or fileobj, mode='w|') as tar:
+            yield tar
+    finally:
+        if compressed:
+            compressed.close()
+
+
+class __ChunkWriter:
+    '''
+    File object passing the written data to the reading thread in chunks
+    '''
+    chunk_size = 1024 * 1024
+
+    def __init__(self, chunks:queue.Queue):
+        self.chunks = chunks
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+
+        while len(self.buffer) >= self.chunk_size:
+            self.chunks.put(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size]
+
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.buffer:
+            self.chunks.put(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def stream_archive(compression:str, level:int, add_entries:callable):
+    '''
+    Yields chunks of the compressed archive, which is written by `add_entries(tar)` on a separate thread.
+    Only a few chunks are kept in memory, writing waits for the consumer
+    '''
+    chunks = queue.Queue(maxsize=8)
+    end = object()
+    errors = []
+
+    def write():
+        try:
+            writer = __ChunkWriter(chunks)
+            with open_tar_for_writing(writer, compression, level) as tar:
+                add_entries(tar)
+            writer.close()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            chunks.put(end)
+
+    thread = threading.Thread(target=write, name='archive', daemon=True)
+    thread.start()
+
+    try:
+        while (chunk := chunks.get()) is not end:
+            yield chunk
+    finally:
+        # Unblock the writer if the upload failed
+        while thread.is_alive():
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    if errors:
+        raise errors[0]
+
+
+@contextmanager
+def open_tar_for_reading(path:str):
+    if path.endswith('.zst'):
+        zstandard = import_zstandard()
+
+        with open(path, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as reader, tarfile.open(fileobj=reader, mode='r|') as tar:
+            yield tar
+    else:
+        with tarfile.open(path, 'r') as tar:
+            yield tar
+
+
+class __ChunkReader:
+    '''
+    File object returning the decompressed data of the chunks
+    '''
+    def __init__(self, chunks, decompressor):
+        self.chunks = iter(chunks)
+        self.decompressor = decompressor
+        self.buffer = bytearray()
+
+    def read(self, size:int=-1) -> bytes:
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += self.decompressor.decompress(chunk)
+
+        if size < 0:
+            size = len(self.buffer)
+
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def extract_stream(chunks, compression:str, target_dir:str, root:str=None, member_filter:callable=None):
+    '''
+    Extracts the archive while its chunks are received, without storing it. With `root` only the members
+    inside it are extracted, relative to it. Members rejected by `member_filter(name)` are skipped
+    '''
+    root_prefix = f'{root}/' if root else ''
+
+    def strip_root(name:str):
+        return name[len(root_prefix):] if name.startswith(root_prefix) else None
+
+    with tarfile.open(fileobj=__ChunkReader(chunks, create_decompressor(compression)), mode='r|') as tar:
+        for member in tar:
+            name = strip_root(member.name)
+            if not name or (member_filter and not member_filter(name)):
+                continue
+
+            member.name = name
+            if member.islnk():
+                member.linkname = strip_root(member.linkname) or member.linkname
+
+            tar.extract(member, path=target_dir)
+
+
 def __add_metadata(tar:tarfile.TarFile, metadata_file:str):
     if metadata_file:
         if not os.path.exists(metadata_file):
@@ -35,87 +206,342 @@ def __add_metadata(tar:tarfile.TarFile, metadata_file:str):
         tar.add(metadata_file, arcname='metadata.yml')
 
 
-def upload_cache(remote:str, username:str, password:str, key:str, group_id:str, cache_id:str, compression:str='xz', metadata_file:str=None):
+def upload_cache(remote:str, username:str, password:str, key:str, group_id:str, cache_id:str, compression:str='xz', metadata_file:str=None, compression_level:int=None, cache_format:str='archive'):
     cache_file_name = get_cache_file_name(cache_id, compression=compression)
-    temp_cache_path = os.path.join(directories.temp_dir, cache_file_name)
-
-    os.makedirs(directories.temp_dir, exist_ok=True)
+    artifactoy = get_artifactory(remote, username=username, password=password, key=key)
+
+    if cache_format == 'snapshot':
+        # Files are shared with the previous snapshots of the group, only the new ones are uploaded
+        snapshot_path = f'{group_id}/conan/{sys.platform.lower()}/{cache_id}{snapshot_suffix}'
+        sources = [(directories.conan_home_dir, 'conan')]
+        if metadata_file:
+            if not os.path.exists(metadata_file):
+                raise Exception(f'Metadata file {metadata_file} does not exist')
+            sources.append((metadata_file, 'metadata.yml'))
+
+        print(f'Uploading snapshot {snapshot_path} to {remote}', flush=True)
+        with trace('snapshot and upload', 'remote_cache', entry=snapshot_path, compression=compression):
+            uri = upload_snapshot(artifactoy, group_id, snapshot_path, sources, compression, compression_level)
+        print(f'Uploaded snapshot to {uri}', flush=True)
+    elif cache_format == 'packages':
+        __upload_package_archives(artifactoy, group_id, cache_id, compression, compression_level, metadata_file)
+    else:
+        __upload_conan_archive(artifactoy, remote, group_id, cache_file_name, compression, compression_level, metadata_file)
 
-    if os.path.exists(cache_file_name):
-        os.unlink(cache_file_name)
+    __upload_debug_archive(artifactoy, remote, group_id, cache_file_name, compression, compression_level, metadata_file)
 
-    tar_mode = f'w:{compression}' if compression != 'none' else 'w'
 
-    with tarfile.open(temp_cache_path, tar_mode) as tar:
-        print(f'Adding {directories.conan_home_dir} to {temp_cache_path}')
+def __upload_conan_archive(artifactoy:ArtifactoryInstance, remote:str, group_id:str, cache_file_name:str, compression:str, compression_level:int, metadata_file:str):
+    def add_conan_home(tar:tarfile.TarFile):
+        print(f'Adding {directories.conan_home_dir} to {cache_file_name}', flush=True)
         tar.add(directories.conan_home_dir, arcname='conan')
         __add_metadata(tar, metadata_file)
 
-    temp_debug_path = os.path.join(directories.temp_dir, f'debug_{cache_file_name}')
+    # Archive is uploaded while it is being created, without a temporary file
+    print(f'Uploading {cache_file_name} to {remote}', flush=True)
+    with trace('archive and upload', 'remote_cache', entry=cache_file_name, compression=compression):
+        uri = artifactoy.upload_stream(
+            f'{group_id}/conan/{sys.platform.lower()}/{cache_file_name}',
+            stream_archive(compression, compression_level, add_conan_home))
+    print(f'Uploaded {cache_file_name} to {uri}', flush=True)
+
+
+def __read_cache_entries(conan_home_dir:str) -> list[dict]:
+    '''
+    Returns the recipe revisions stored in the cache with their package revisions. Paths are relative to the storage folder
+    '''
+    db_path = os.path.join(conan_home_dir, 'p', 'cache.sqlite3')
+    con = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+
+    try:
+        recipes = {}
+        for reference, rrev, path in con.execute('SELECT reference, rrev, path FROM recipes'):
+            recipes[(reference, rrev)] = { 'reference': reference, 'rrev': rrev, 'path': path.replace('\\', '/'), 'packages': [] }
+
+        for reference, rrev, pkgid, prev, path in con.execute('SELECT reference, rrev, pkgid, prev, path FROM packages'):
+            recipe = recipes.get((reference, rrev), None)
+            # Packages without a revision were not built successfully
+            if recipe and prev:
+                recipe['packages'].append({ 'pkgid': pkgid, 'prev': prev, 'path': path.replace('\\', '/') })
+    finally:
+        con.close()
+
+    return sorted(recipes.values(), key=lambda recipe: (recipe['reference'], recipe['rrev']))
+
+
+def __upload_package_archives(artifactoy:ArtifactoryInstance, group_id:str, cache_id:str, compression:str, compression_level:int, metadata_file:str, jobs:int=8):
+    '''
+    Uploads every recipe and package revision of the cache as a separate archive and an index listing them.
+    Revisions identify the content, so archives already stored by the previous builds of the group are reused
+    '''
+    platform = sys.platform.lower()
+    storage_dir = os.path.join(directories.conan_home_dir, 'p')
+    packages_prefix = f'{group_id}/packages/{platform}'
+
+    recipes = __read_cache_entries(directories.conan_home_dir)
+    archives = []
+
+    for recipe in recipes:
+        recipe_prefix = f"{packages_prefix}/{recipe['reference'].replace('@', '/')}/{recipe['rrev']}"
+        recipe['archive'] = f"{recipe_prefix}/{get_cache_file_name('recipe', compression)}"
+        archives.append((recipe['archive'], recipe['path']))
+
+        for package in recipe['packages']:
+            package['archive'] = f"{recipe_prefix}/{package['pkgid']}/{get_cache_file_name(package['prev'], compression)}"
+            archives.append((package['archive'], package['path']))
+
+    existing_archives = set(artifactoy.list_files(packages_prefix))
+    missing_archives = [archive for archive in archives if archive[0] not in existing_archives]
+
+    print(f'Cache has {len(archives)} recipe and package revisions, uploading {len(missing_archives)} missing', flush=True)
+
+    def upload_archive(archive:tuple[str, str]):
+        remote_path, path = archive
+
+        def add_folder(tar:tarfile.TarFile):
+            tar.add(os.path.join(storage_dir, path), arcname=path)
+
+        with trace('archive and upload', 'remote_cache', entry=remote_path, compression=compression):
+            artifactoy.upload_stream(remote_path, stream_archive(compression, compression_level, add_folder))
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(upload_archive, missing_archives))
+
+    # Everything but the recipe and package folders: configuration, profiles and the cache database
+    archived_paths = { f'conan/p/{path}' for _, path in archives }
+
+    def add_conan_home(tar:tarfile.TarFile):
+        tar.add(directories.conan_home_dir, arcname='conan', filter=lambda info: None if info.name in archived_paths else info)
+        __add_metadata(tar, metadata_file)
+
+    home_path = f"{group_id}/homes/{platform}/{get_cache_file_name(cache_id, compression)}"
+    with trace('archive and upload', 'remote_cache', entry=home_path, compression=compression):
+        artifactoy.upload_stream(home_path, stream_archive(compression, compression_level, add_conan_home))
+
+    index = {
+        'version': 1,
+        'home': home_path,
+        'recipes': recipes,
+    }
+
+    # Index goes last, so it never references missing archives
+    index_path = f'{group_id}/conan/{platform}/{cache_id}{package_index_suffix}'
+    uri = artifactoy.upload_stream(index_path, [json.dumps(index, indent=1).encode('utf-8')])
+    print(f'Uploaded package index to {uri}', flush=True)
+
+
+def __upload_debug_archive(artifactoy:ArtifactoryInstance, remote:str, group_id:str, cache_file_name:str, compression:str, compression_level:int, metadata_file:str):
     debug_symbols_dir = os.path.join(directories.temp_dir, 'debug_processors')
     if os.path.exists(debug_symbols_dir):
-        with tarfile.open(temp_debug_path, tar_mode) as tar:
-            print(f'Adding {debug_symbols_dir} to {temp_cache_path}')
+        def add_debug_symbols(tar:tarfile.TarFile):
+            print(f'Adding {debug_symbols_dir} to debug_{cache_file_name}', flush=True)
             tar.add(debug_symbols_dir, arcname='debug_processors')
             __add_metadata(tar, metadata_file)
 
-    try:
-        artifactoy = get_artifactory(remote, username=username, password=password, key=key)
-        print(f'Uploading {temp_cache_path} to {remote}')
-        uri = artifactoy.upload_file(f'{group_id}/conan/{sys.platform.lower()}/{cache_file_name}', temp_cache_path)
-        print(f'Uploaded {temp_cache_path} to {uri}')
-
-        if os.path.exists(temp_debug_path):
-            print(f'Uploading {temp_debug_path} to {remote}')
-            uri = artifactoy.upload_file(f'{group_id}/debug/{sys.platform.lower()}/{cache_file_name}', temp_debug_path)
-            print(f'Uploaded {temp_debug_path} to {uri}')
-    finally:
-        if os.path.exists(temp_cache_path):
-           os.unlink(temp_cache_path)
+        print(f'Uploading debug_{cache_file_name} to {remote}', flush=True)
+        with trace('archive and upload', 'remote_cache', entry=f'debug_{cache_file_name}', compression=compression):
+            uri = artifactoy.upload_stream(
+                f'{group_id}/debug/{sys.platform.lower()}/{cache_file_name}',
+                stream_archive(compression, compression_level, add_debug_symbols))
+        print(f'Uploaded debug_{cache_file_name} to {uri}', flush=True)
+
+
+def __get_archive_paths(prefix:str, cache_id:str, compression:str) -> list[str]:
+    # Archive may be stored with another compression than requested, the requested one goes first
+    compressions = [compression] + [c for c in supported_compressions if c != compression]
+    return [f'{prefix}/{get_cache_file_name(cache_id, compression=c)}' for c in compressions]
 
 
 def delete_cache(remote:str, username:str, password:str, key:str, group_id:str, cache_id:str, compression:str='xz'):
+    '''
+    Deletes the cache of the current platform stored as an archive, a snapshot or a package index, with its debug archive.
+    Snapshot blobs and package archives are shared by all caches of the group, they are only deleted with the whole group
+    '''
     artifactory = get_artifactory(remote, username=username, password=password, key=key)
-    if cache_id:
-        artifactory.delete_uri(f'{group_id}/{get_cache_file_name(cache_id, compression=compression)}')
-    else:
+    if not cache_id:
         artifactory.delete_uri(group_id)
+        return
+
+    platform = sys.platform.lower()
+    cache_prefix = f'{group_id}/conan/{platform}'
+
+    paths = __get_archive_paths(cache_prefix, cache_id, compression) + [
+        f'{cache_prefix}/{cache_id}{snapshot_suffix}',
+        f'{cache_prefix}/{cache_id}{package_index_suffix}',
+    ] + __get_archive_paths(f'{group_id}/homes/{platform}', cache_id, compression) + __get_archive_paths(f'{group_id}/debug/{platform}', cache_id, compression)
+
+    deleted = 0
+    for path in paths:
+        if artifactory.file_exists(path):
+            print(f'Deleting {path}', flush=True)
+            artifactory.delete_uri(path)
+            deleted += 1
+
+    if deleted == 0:
+        raise Exception(f'Cache {cache_id} was not found in {cache_prefix}')
 
 
 def list_cache(remote:str, username:str, password:str, key:str, group_id:str):
     artifactory = get_artifactory(remote, username=username, password=password, key=key)
     return artifactory.list_files(group_id)
 
-def __fix_win_cache_for_upload(conan_home_dir:str):
-    print(f'Fixing win cache for upload', flush=True)
+def __fix_cache_paths(conan_home_dir:str):
+    '''
+    Makes the paths of the cache database usable on the current machine: Windows separators are replaced
+    and absolute paths, written by a cache in another root directory, are made relative to the storage folder
+    '''
+    print(f'Fixing cache paths in {conan_home_dir}', flush=True)
     db_path = os.path.join(conan_home_dir, 'p', 'cache.sqlite3')
 
     con = sqlite3.connect(db_path)
 
     try:
-        con.execute('UPDATE packages SET path = REPLACE(path, \'\\\', \'/\')')
+        for table in ('recipes', 'packages'):
+            con.execute(f'UPDATE {table} SET path = REPLACE(path, \'\\\', \'/\')')
+
+            for (path,) in con.execute(f'SELECT path FROM {table}').fetchall():
+                if path.startswith('/') or ':' in path:
+                    con.execute(f'UPDATE {table} SET path = ? WHERE path = ?', (path.rpartition('/p/')[2], path))
+        con.commit()
+    finally:
+        con.close()
+
+def __download_and_extract(artifactory:ArtifactoryInstance, remote_path:str, target_dir:str, root:str=None, member_filter:callable=None):
+    with trace('download and extract', 'remote_cache', entry=remote_path):
+        extract_stream(artifactory.get_stream(remote_path), get_compression(remote_path), target_dir, root, member_filter)
+
+
+def __select_recipes(index:dict, package_names:list[str]) -> list[dict]:
+    if package_names is None:
+        return index['recipes']
+
+    package_names = set(package_names)
+    return [recipe for recipe in index['recipes'] if recipe['reference'].partition('/')[0] in package_names]
+
+
+def __restore_recipes(artifactory:ArtifactoryInstance, recipes:list[dict], conan_home_dir:str, jobs:int):
+    archives = [(recipe['archive'], recipe['path']) for recipe in recipes]
+    archives += [(package['archive'], package['path']) for recipe in recipes for package in recipe['packages']]
+
+    storage_dir = os.path.join(conan_home_dir, 'p')
+
+    # Parent folders are shared by the archives extracted in parallel
+    for _, path in archives:
+        os.makedirs(os.path.join(storage_dir, os.path.dirname(path)), exist_ok=True)
+
+    print(f'Restoring {len(recipes)} recipes and {len(archives) - len(recipes)} packages to {storage_dir}', flush=True)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(lambda archive: __download_and_extract(artifactory, archive[0], storage_dir), archives))
+
+
+def __get_restored_paths(recipes:list[dict]) -> tuple[set[str], set[str]]:
+    return { recipe['path'] for recipe in recipes }, { package['path'] for recipe in recipes for package in recipe['packages'] }
+
+
+def __prune_cache_db(db_path:str, recipes:list[dict]):
+    '''
+    Removes the revisions which were not restored from the cache database
+    '''
+    recipe_paths, package_paths = __get_restored_paths(recipes)
+
+    con = sqlite3.connect(db_path)
+
+    try:
+        for table, paths in (('recipes', recipe_paths), ('packages', package_paths)):
+            stored_paths = [row[0] for row in con.execute(f'SELECT path FROM {table}')]
+            con.executemany(f'DELETE FROM {table} WHERE path = ?', [(path,) for path in stored_paths if path.replace('\\', '/') not in paths])
+        con.commit()
+    finally:
+        con.close()
+
+
+def __merge_cache_db(db_path:str, source_db_path:str, recipes:list[dict]=None):
+    '''
+    Adds the restored revisions to an existing cache database. Without `recipes` all the revisions are added
+    '''
+    recipe_paths, package_paths = __get_restored_paths(recipes) if recipes is not None else (None, None)
+
+    con = sqlite3.connect(db_path)
+
+    try:
+        con.execute('ATTACH DATABASE ? AS source', (source_db_path,))
+        for table, paths in (('recipes', recipe_paths), ('packages', package_paths)):
+            columns = [column[1] for column in con.execute(f'PRAGMA source.table_info({table})')]
+            path_index = columns.index('path')
+            rows = [row for row in con.execute(f'SELECT * FROM source.{table}') if paths is None or row[path_index].replace('\\', '/') in paths]
+            con.executemany(f'INSERT OR REPLACE INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', rows)
         con.commit()
+        con.execute('DETACH DATABASE source')
     finally:
         con.close()
 
-def __process_cache(artifactory:ArtifactoryInstance, path_prefix:str, entry_handler:callable):
+
+def __process_package_index(artifactory:ArtifactoryInstance, path_prefix:str, entry:str, entry_handler:callable, select_packages:callable):
+    cache_dir = os.path.join(directories.temp_dir, 'remote_cache', path_prefix, Path(entry).name[:-len(package_index_suffix)])
+
+    try:
+        index = json.loads(b''.join(artifactory.get_stream(entry)))
+
+        print(f'Restoring {entry} to {cache_dir}', flush=True)
+        with trace('restore', 'remote_cache', entry=entry):
+            __download_and_extract(artifactory, index['home'], cache_dir)
+
+            conan_home_dir = os.path.join(cache_dir, 'conan')
+            recipes = __select_recipes(index, select_packages(cache_dir) if select_packages else None)
+            __restore_recipes(artifactory, recipes, conan_home_dir, 8)
+            __prune_cache_db(os.path.join(conan_home_dir, 'p', 'cache.sqlite3'), recipes)
+
+        with trace('process', 'remote_cache', entry=entry):
+            entry_handler(cache_dir)
+    finally:
+        safe_rm_tree(cache_dir)
+
+def __process_snapshot(artifactory:ArtifactoryInstance, group_id:str, path_prefix:str, entry:str, entry_handler:callable):
+    cache_dir = os.path.join(directories.temp_dir, 'remote_cache', path_prefix, Path(entry).name[:-len(snapshot_suffix)])
+
+    try:
+        print(f'Restoring snapshot {entry} to {cache_dir}', flush=True)
+        with trace('restore', 'remote_cache', entry=entry):
+            restore_snapshot(artifactory, group_id, entry, cache_dir)
+
+        with trace('process', 'remote_cache', entry=entry):
+            entry_handler(cache_dir)
+    finally:
+        safe_rm_tree(cache_dir)
+
+def __process_cache(artifactory:ArtifactoryInstance, group_id:str, path_prefix:str, entry_handler:callable, select_packages:callable=None):
+    '''
+    Calls the handler for every cache stored under the prefix. For the per-package caches only the packages
+    returned by `select_packages(cache_dir)` are restored
+    '''
     entries = artifactory.list_files(path_prefix)
 
     for entry in entries:
+        if entry.endswith(snapshot_suffix):
+            __process_snapshot(artifactory, group_id, path_prefix, entry, entry_handler)
+            continue
+
+        if entry.endswith(package_index_suffix):
+            __process_package_index(artifactory, path_prefix, entry, entry_handler, select_packages)
+            continue
+
         local_path = os.path.join(directories.temp_dir, entry)
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
 
         print(f'Downloading {entry} to {local_path}', flush=True)
-        artifactory.get_file(entry, local_path)
+        with trace('download', 'remote_cache', entry=entry):
+            artifactory.get_file(entry, local_path)
 
         cache_dir = os.path.join(directories.temp_dir, 'remote_cache', path_prefix, Path(entry).stem)
 
         try:
-            with tarfile.open(local_path, 'r') as tar:
+            with trace('extract', 'remote_cache', path=local_path), open_tar_for_reading(local_path) as tar:
                 print(f'Extracting {local_path} to {cache_dir}', flush=True)
                 tar.extractall(path=cache_dir)
 
-            entry_handler(cache_dir)
+            with trace('process', 'remote_cache', entry=entry):
+                entry_handler(cache_dir)
         finally:
             safe_rm_tree(cache_dir)
             os.unlink(local_path)
@@ -145,7 +571,11 @@ class __Metadata:
     def platform_is_win32(self):
         return self.platform and self.platform == 'win32'
 
-def process_conan_cache(remote:str, username:str, password:str, key:str, group_id:str, recipes_remote:str, binaries_remote:str):
+def process_conan_cache(remote:str, username:str, password:str, key:str, group_id:str, recipes_remote:str, binaries_remote:str, build_order:str=None):
+    def get_cache_build_order(cache_dir:str):
+        metadata = __Metadata(cache_dir)
+        return get_build_order(build_order or metadata.build_order, metadata.platform)
+
     def process(cache_dir:str):
         try:
             old_conan_home_dir = directories.conan_home_dir
@@ -154,17 +584,105 @@ def process_conan_cache(remote:str, username:str, password:str, key:str, group_i
                 metadata = __Metadata(cache_dir)
 
                 if metadata.platform_is_win32 and sys.platform.lower() != 'win32':
-                    __fix_win_cache_for_upload(directories.conan_home_dir)
+                    __fix_cache_paths(directories.conan_home_dir)
 
                 upload_all(
                     recipes_remote, binaries_remote,
                     metadata.upload_build_tools,
-                    get_build_order(metadata.build_order, metadata.platform))
+                    get_cache_build_order(cache_dir))
         finally:
             directories.conan_home_dir = old_conan_home_dir
 
     artifactory = get_artifactory(remote, username=username, password=password, key=key)
-    __process_cache(artifactory, f'{group_id}/conan', process)
+    __process_cache(artifactory, group_id, f'{group_id}/conan', process, get_cache_build_order)
+
+
+def __restore_package_index(artifactory:ArtifactoryInstance, index_path:str, build_order:str, platform:str, jobs:int):
+    index = json.loads(b''.join(artifactory.get_stream(index_path)))
+    recipes = __select_recipes(index, get_build_order(build_order, platform))
+
+    home_dir = os.path.join(directories.temp_dir, 'remote_cache', index_path[:-len(package_index_suffix)])
+
+    try:
+        __download_and_extract(artifactory, index['home'], home_dir)
+        __restore_recipes(artifactory, recipes, directories.conan_home_dir, jobs)
+
+        db_path = os.path.join(directories.conan_home_dir, 'p', 'cache.sqlite3')
+        source_db_path = os.path.join(home_dir, 'conan', 'p', 'cache.sqlite3')
+
+        if os.path.exists(db_path):
+            __merge_cache_db(db_path, source_db_path, recipes)
+        else:
+            # New Conan home gets the configuration of the cache as well
+            shutil.copytree(os.path.join(home_dir, 'conan'), directories.conan_home_dir, dirs_exist_ok=True)
+            __prune_cache_db(db_path, recipes)
+    finally:
+        safe_rm_tree(home_dir)
+
+    print(f'Restored {len(recipes)} recipes from {index_path}', flush=True)
+
+
+def __restore_conan_home(artifactory:ArtifactoryInstance, group_id:str, remote_path:str, jobs:int):
+    '''
+    Restores the whole Conan home from an archive or a snapshot. Revisions already in the local cache are kept
+    '''
+    db_path = os.path.join(directories.conan_home_dir, 'p', 'cache.sqlite3')
+    local_db_path = f'{db_path}.local'
+
+    if os.path.exists(db_path):
+        os.replace(db_path, local_db_path)
+
+    try:
+        if remote_path.endswith(snapshot_suffix):
+            restore_snapshot(artifactory, group_id, remote_path, directories.conan_home_dir, jobs, root='conan')
+        else:
+            # Archive is extracted while it is downloaded, without a temporary file
+            __download_and_extract(artifactory, remote_path, directories.conan_home_dir, root='conan')
+    except BaseException:
+        # Restored database may reference folders which were not restored
+        if os.path.exists(db_path):
+            os.unlink(db_path)
+        if os.path.exists(local_db_path):
+            os.replace(local_db_path, db_path)
+        raise
+
+    if os.path.exists(local_db_path):
+        if os.path.exists(db_path):
+            __merge_cache_db(db_path, local_db_path)
+            os.unlink(local_db_path)
+        else:
+            os.replace(local_db_path, db_path)
+
+    print(f'Restored {remote_path}', flush=True)
+
+
+def restore_cache(remote:str, username:str, password:str, key:str, group_id:str, cache_id:str, compression:str='xz', build_order:str=None, platform:str=None, jobs:int=8):
+    '''
+    Restores the remote cache into the Conan home. Only the packages of the build order are restored
+    from the per-package caches, archives and snapshots are restored completely
+    '''
+    artifactory = get_artifactory(remote, username=username, password=password, key=key)
+    cache_prefix = f'{group_id}/conan/{sys.platform.lower()}'
+
+    index_path = f'{cache_prefix}/{cache_id}{package_index_suffix}'
+    snapshot_path = f'{cache_prefix}/{cache_id}{snapshot_suffix}'
+
+    archive_paths = __get_archive_paths(cache_prefix, cache_id, compression)
+
+    print(f'Restoring cache {cache_id} to {directories.conan_home_dir}', flush=True)
+
+    with trace('restore', 'remote_cache', cache_id=cache_id):
+        if artifactory.file_exists(index_path):
+            __restore_package_index(artifactory, index_path, build_order, platform, jobs)
+        elif artifactory.file_exists(snapshot_path):
+            __restore_conan_home(artifactory, group_id, snapshot_path, jobs)
+        elif archive_path := next((path for path in archive_paths if artifactory.file_exists(path)), None):
+            __restore_conan_home(artifactory, group_id, archive_path, jobs)
+        else:
+            raise Exception(f'Cache {cache_id} was not found in {cache_prefix}')
+
+    # Cache may be stored from another root directory or from a Windows machine
+    __fix_cache_paths(directories.conan_home_dir)
 
 
 def process_debug_cache(remote:str, username:str, password:str, key:str, group_id:str):
@@ -188,4 +706,4 @@ def process_debug_cache(remote:str, username:str, password:str, key:str, group_i
                 print(f'Error processing debug symbols in {entry}: {e}', flush=True)
 
     artifactory = get_artifactory(remote, username=username, password=password, key=key)
-    __process_cache(artifactory, f'{group_id}/debug/{sys.platform.lower()}', process)
+    __process_cache(artifactory, group_id, f'{group_id}/debug/{sys.platform.lower()}', process)
@@ -1,10 +1,7 @@
-import subprocess
-import json
-from impl.utils import get_conan
+from impl import conan_backend
 
 def list_remotes() -> list[str]:
-    remotes = subprocess.check_output([get_conan(), 'remote', 'list', '--format', 'json']).decode('utf-8')
-    return json.loads(remotes)
+    return conan_backend.list_remotes()
 
 def add_remote(name:str, url:str) -> None:
     remotes = list_remotes()
@@ -12,14 +9,14 @@ def add_remote(name:str, url:str) -> None:
         if remote['name'] != name:
             continue
         if remote['url'] != url:
-            subprocess.check_call([get_conan(), 'remote', 'update', '--url', name])
+            conan_backend.call(['remote', 'update', '--url', name])
         return False
 
-    subprocess.check_call([get_conan(), 'remote', 'add', name, url])
+    conan_backend.call(['remote', 'add', name, url])
     return True
 
 def remove_remote(name:str) -> None:
     try:
-        subprocess.check_call([get_conan(), 'remote', 'remove', name])
+        conan_backend.call(['remote', 'remove', name])
     finally:
         pass
@@ -0,0 +1,229 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+
+# Interval of process tree sampling, in seconds
+sample_interval = 1.0
+
+
+class ResourceUsage:
+    def __init__(self):
+        self.peak_rss = 0
+        self.cpu_time = 0.0
+        self.disk_usage = 0
+
+        # Collected by ProcessTreeSampler
+        self.sampled_time = 0.0
+        self.sampled_cpu_time = 0.0
+        self.peak_tree_rss = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+
+    def update(self, peak_rss:int, cpu_time:float):
+        self.peak_rss = max(self.peak_rss, peak_rss)
+        self.cpu_time += cpu_time
+
+    def update_sampled(self, sampler:'ProcessTreeSampler'):
+        self.sampled_time += sampler.elapsed
+        self.sampled_cpu_time += sampler.cpu_time
+        self.peak_tree_rss = max(self.peak_tree_rss, sampler.peak_rss)
+        self.read_bytes += sampler.read_bytes
+        self.write_bytes += sampler.write_bytes
+
+    @property
+    def average_cpu_utilization(self):
+        '''
+        Average share of all CPU cores used while the processes were running
+        '''
+        if self.sampled_time <= 0:
+            return None
+        return self.sampled_cpu_time / self.sampled_time / (os.cpu_count() or 1)
+
+    def get_summary(self):
+        utilization = self.average_cpu_utilization
+
+        if utilization is None:
+            return None
+
+        megabyte = 1024 * 1024
+
+        return (
+            f'{utilization * 100:.0f}% avg CPU on {os.cpu_count()} cores, '
+            f'peak RSS {self.peak_tree_rss // megabyte} MB, '
+            f'read {self.read_bytes // megabyte} MB, written {self.write_bytes // megabyte} MB')
+
+
+class ProcessTreeSampler:
+    '''
+    Periodically walks /proc and samples CPU time, RSS and I/O of the process and all its descendants.
+    Times and I/O of finished processes are accounted to their parents once they are waited for,
+    so the totals are sums over the live processes of the tree
+    '''
+    def __init__(self, pid:int, interval:float):
+        self.pid = pid
+        self.interval = interval
+
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+
+        self.start_time = time.monotonic()
+        self.elapsed = 0.0
+        self.cpu_time = 0.0
+        self.peak_rss = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__run, name=f'sampler-{pid}', daemon=True)
+
+    @staticmethod
+    def is_supported():
+        return os.path.isdir('/proc/self') and hasattr(os, 'sysconf')
+
+    def __read_stat(self, pid:str):
+        with open(f'/proc/{pid}/stat', 'r') as f:
+            stat = f.read()
+
+        # Process name is in parentheses and can contain spaces
+        fields = stat[stat.rindex(')') + 2:].split()
+
+        ppid = int(fields[1])
+        cpu_ticks = sum(int(field) for field in fields[11:15])
+        rss = int(fields[21]) * self.page_size
+
+        return ppid, cpu_ticks, rss
+
+    def __read_io(self, pid:int):
+        read_bytes, write_bytes = 0, 0
+
+        try:
+            with open(f'/proc/{pid}/io', 'r') as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    if key == 'read_bytes':
+                        read_bytes = int(value)
+                    elif key == 'write_bytes':
+                        write_bytes = int(value)
+        except (OSError, ValueError):
+            pass
+
+        return read_bytes, write_bytes
+
+    def __sample(self):
+        stats = {}
+
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                stats[int(entry)] = self.__read_stat(entry)
+            except (OSError, ValueError, IndexError):
+                continue
+
+        children = {}
+        for pid, (ppid, _, _) in stats.items():
+            children.setdefault(ppid, []).append(pid)
+
+        tree = []
+        stack = [self.pid]
+        while stack:
+            pid = stack.pop()
+            if pid in stats:
+                tree.append(pid)
+                stack += children.get(pid, [])
+
+        if not tree:
+            return
+
+        cpu_time = sum(stats[pid][1] for pid in tree) / self.clock_ticks
+        rss = sum(stats[pid][2] for pid in tree)
+        io = [self.__read_io(pid) for pid in tree]
+
+        # Processes finished but not yet waited for are missing from the sums, so the totals only grow
+        self.cpu_time = max(self.cpu_time, cpu_time)
+        self.peak_rss = max(self.peak_rss, rss)
+        self.read_bytes = max(self.read_bytes, sum(read for read, _ in io))
+        self.write_bytes = max(self.write_bytes, sum(write for _, write in io))
+
+    def __run(self):
+        while not self.stopped.wait(self.interval):
+            self.__sample()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.elapsed = time.monotonic() - self.start_time
+
+
+__current_usage = threading.local()
+
+
+@contextmanager
+def track_resource_usage():
+    '''
+    Collects the resource usage of all processes started with `check_call` by the current thread
+    '''
+    usage = ResourceUsage()
+    previous_usage = getattr(__current_usage, 'usage', None)
+    __current_usage.usage = usage
+
+    try:
+        yield usage
+    finally:
+        __current_usage.usage = previous_usage
+
+
+def record_disk_usage(disk_usage:int):
+    '''
+    Records the size of the folders used by the package tracked by the current thread
+    '''
+    usage = getattr(__current_usage, 'usage', None)
+
+    if usage:
+        usage.disk_usage = max(usage.disk_usage, disk_usage)
+
+
+def check_call(cmd:list[str], **kwargs):
+    usage = getattr(__current_usage, 'usage', None)
+
+    if not usage or not hasattr(os, 'wait4'):
+        return subprocess.check_call(cmd, **kwargs)
+
+    process = subprocess.Popen(cmd, **kwargs)
+
+    sampler = ProcessTreeSampler(process.pid, sample_interval) if ProcessTreeSampler.is_supported() else None
+    if sampler:
+        sampler.start()
+
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        if sampler:
+            sampler.stop()
+
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    peak_rss = rusage.ru_maxrss if sys.platform == 'darwin' else rusage.ru_maxrss * 1024
+    usage.update(peak_rss, rusage.ru_utime + rusage.ru_stime)
+
+    if sampler:
+        # Exact totals of the whole tree are known once the process is waited for
+        sampler.cpu_time = max(sampler.cpu_time, rusage.ru_utime + rusage.ru_stime)
+        usage.update_sampled(sampler)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+    return 0
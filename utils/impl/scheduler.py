@@ -0,0 +1,202 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from impl.build_history import format_duration
+
+
+class BuildScheduler:
+    def __init__(self, build_order:list[str], dependencies:dict[str, set[str]], jobs:int=1, completed:list[str] = None, durations:dict[str, float] = None, disk_budget=None, memory_planner=None):
+        self.build_order = list(build_order)
+        self.jobs = max(1, jobs or 1)
+        self.disk_budget = disk_budget
+        self.memory_planner = memory_planner
+        self.dependencies = {}
+        self.dependents = {package_name: set() for package_name in self.build_order}
+
+        packages = set(self.build_order)
+
+        for package_name in self.build_order:
+            package_dependencies = set(dependencies.get(package_name, set())) & packages
+            package_dependencies.discard(package_name)
+            self.dependencies[package_name] = package_dependencies
+
+            for dependency in package_dependencies:
+                self.dependents[dependency].add(package_name)
+
+        # Packages completed by a previous run
+        self.previously_completed = set(completed or []) & packages
+
+        self.durations = self.__get_durations(durations or {})
+        self.priorities = self.__get_priorities()
+
+        self.completed = []
+        self.failed = {}
+        self.skipped = {}
+
+    def __get_durations(self, known_durations:dict[str, float]) -> dict[str, float]:
+        known_durations = { name: duration for name, duration in known_durations.items() if name in self.dependents }
+
+        # Packages without history are assumed to take an average time
+        default_duration = sum(known_durations.values()) / len(known_durations) if known_durations else 0.0
+
+        return { package_name: known_durations.get(package_name, default_duration) for package_name in self.build_order }
+
+    def __get_priorities(self) -> dict[str, float]:
+        # Length of the longest path from the package to the end of the build, so
+        # long chains and long packages start first and do not end up as a tail
+        priorities = {}
+        visiting = set()
+
+        def get_priority(package_name:str):
+            if package_name not in priorities:
+                # Packages in a dependency cycle are never scheduled, `run` reports them
+                if package_name in visiting:
+                    return 0.0
+                visiting.add(package_name)
+                priorities[package_name] = self.durations[package_name] + max((get_priority(dependent) for dependent in self.dependents[package_name]), default=0.0)
+            return priorities[package_name]
+
+        for package_name in reversed(self.build_order):
+            get_priority(package_name)
+
+        return priorities
+
+    def __get_downstream(self, package_name:str) -> set[str]:
+        downstream = set()
+        stack = [package_name]
+
+        while stack:
+            for dependent in self.dependents[stack.pop()]:
+                if dependent not in downstream:
+                    downstream.add(dependent)
+                    stack.append(dependent)
+
+        return downstream
+
+    def __mark_failed(self, package_name:str, error:Exception, pending:set[str]):
+        self.failed[package_name] = error
+
+        for dependent in self.__get_downstream(package_name):
+            if dependent in pending:
+                pending.remove(dependent)
+                self.skipped[dependent] = package_name
+
+    def __get_ready(self, pending:set[str], done:set[str]) -> list[str]:
+        ready = [
+            (index, package_name) for index, package_name in enumerate(self.build_order)
+            if package_name in pending and self.dependencies[package_name] <= done
+        ]
+
+        return [package_name for index, package_name in sorted(ready, key=lambda item: (-self.priorities[item[1]], item[0]))]
+
+    def __print_eta(self, pending:set[str], running:dict[str, float]):
+        if not any(self.durations.values()):
+            return
+
+        now = time.monotonic()
+        remaining = { package_name: self.durations[package_name] for package_name in pending }
+        remaining.update({ package_name: max(0.0, self.durations[package_name] - (now - started)) for package_name, started in running.items() })
+
+        if not remaining:
+            return
+
+        critical_path = max(self.priorities[package_name] - self.durations[package_name] + duration for package_name, duration in remaining.items())
+        eta = max(critical_path, sum(remaining.values()) / self.jobs)
+
+        print(f'Estimated time remaining for {len(remaining)} packages: {format_duration(eta)}', flush=True)
+
+    def __try_reserve(self, package_name:str, force:bool) -> bool:
+        if self.disk_budget and not self.disk_budget.try_reserve(package_name, force):
+            print(f'Disk budget exceeded, waiting for running packages before starting `{package_name}`', flush=True)
+            return False
+
+        if self.memory_planner and not self.memory_planner.try_reserve(package_name, force):
+            if self.disk_budget:
+                self.disk_budget.release(package_name)
+            print(f'Not enough memory, waiting for running packages before starting `{package_name}`', flush=True)
+            return False
+
+        return True
+
+    def __release(self, package_name:str):
+        if self.disk_budget:
+            self.disk_budget.release(package_name)
+
+        if self.memory_planner:
+            self.memory_planner.release(package_name)
+
+    def run(self, action:callable):
+        pending = set(self.build_order) - self.previously_completed
+        done = set(self.previously_completed)
+        running = {}
+        started = {}
+
+        print(f'Processing {len(pending)} packages using {self.jobs} worker(s)', flush=True)
+        self.__print_eta(pending, {})
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while pending or running:
+                for package_name in self.__get_ready(pending, done):
+                    if len(running) >= self.jobs:
+                        break
+
+                    # Nothing would free the space or memory if no package is running
+                    if not self.__try_reserve(package_name, force=not running):
+                        break
+
+                    pending.remove(package_name)
+                    started[package_name] = time.monotonic()
+                    running[executor.submit(action, package_name)] = package_name
+
+                if not running:
+                    # Only possible if the dependency graph contains a cycle
+                    raise RuntimeError(f'Unable to schedule packages: {", ".join(sorted(pending))}')
+
+                finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    package_name = running.pop(future)
+                    duration = time.monotonic() - started.pop(package_name)
+
+                    self.__release(package_name)
+
+                    try:
+                        future.result()
+                        done.add(package_name)
+                        self.completed.append(package_name)
+                        print(f'Finished `{package_name}` in {format_duration(duration)} ({len(done)}/{len(self.build_order)})', flush=True)
+                    except Exception as e:
+                        print(f'Failed `{package_name}`: {e}', flush=True)
+                        self.__mark_failed(package_name, e, pending)
+
+                self.__print_eta(pending, started)
+
+        if len(self.failed) > 0:
+            print('Failed to process the following packages:', flush=True)
+            for package_name, error in self.failed.items():
+                print(f'  {package_name}: {error}', flush=True)
+
+            if len(self.skipped) > 0:
+                print('Skipped the following packages because of failed dependencies:', flush=True)
+                for package_name, failed_dependency in self.skipped.items():
+                    print(f'  {package_name} (depends on {failed_dependency})', flush=True)
+
+            raise Exception('Failed to process some packages')
+
+
+def run_build_order(build_order:list[str], dependencies:dict[str, set[str]], action:callable, jobs:int=1, journal=None, durations:dict[str, float] = None, disk_budget=None, memory_planner=None):
+    if not journal:
+        scheduler = BuildScheduler(build_order, dependencies, jobs, durations=durations, disk_budget=disk_budget, memory_planner=memory_planner)
+        scheduler.run(action)
+        return scheduler
+
+    def run_journaled(package_name:str):
+        action(package_name)
+        journal.mark_completed(package_name)
+
+    scheduler = BuildScheduler(build_order, dependencies, jobs, journal.completed, durations, disk_budget, memory_planner)
+    scheduler.run(run_journaled)
+    journal.finish()
+
+    return scheduler
@@ -0,0 +1,137 @@
+import os
+import threading
+import yaml
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from impl.conan_recipe import ConanRecipe
+from impl.conan_recipe_store import get_recipe
+from impl.files import safe_rm_tree
+from impl.package_reference import PackageReference
+from impl.tracing import trace
+
+
+def __collect_urls(data, urls:list[str]):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key == 'url':
+                # Conan tries mirrors in order, the first one is used unless it fails
+                urls.append(value[0] if isinstance(value, list) else value)
+            else:
+                __collect_urls(value, urls)
+    elif isinstance(data, list):
+        for value in data:
+            __collect_urls(value, urls)
+
+
+def get_source_hosts(recipe:ConanRecipe) -> list[str]:
+    conandata_path = os.path.join(recipe.recipe_dir, 'conandata.yml')
+
+    if not os.path.exists(conandata_path):
+        return []
+
+    with open(conandata_path, 'r') as f:
+        sources = (yaml.safe_load(f) or {}).get('sources', {})
+
+    urls = []
+    __collect_urls(sources.get(recipe.reference.version, {}), urls)
+
+    return sorted({ urlparse(url).hostname for url in urls if isinstance(url, str) and urlparse(url).hostname })
+
+
+class SourcePrefetcher:
+    '''
+    Downloads sources of the next packages from the build order in background,
+    while the current ones are being built
+    '''
+    def __init__(self, build_order:list[str], count:int, downloads_per_host:int=2):
+        self.build_order = list(build_order)
+        self.count = count
+        self.downloads_per_host = max(1, downloads_per_host)
+
+        self.executor = ThreadPoolExecutor(max_workers=max(1, count), thread_name_prefix='prefetch')
+        self.futures = {}
+        self.prefetched = {}
+        self.host_semaphores = {}
+        self.lock = threading.Lock()
+
+    def __get_host_semaphore(self, host:str):
+        with self.lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(self.downloads_per_host)
+            return self.host_semaphores[host]
+
+    def __prefetch(self, package_name:str) -> bool:
+        recipe = get_recipe(PackageReference(package_name=package_name))
+
+        if recipe.is_python_require or os.path.isdir(recipe.local_source_dir):
+            return False
+
+        # Hosts are sorted, so the semaphores are always acquired in the same order
+        semaphores = [self.__get_host_semaphore(host) for host in get_source_hosts(recipe)]
+
+        for semaphore in semaphores:
+            semaphore.acquire()
+
+        try:
+            with trace('prefetch sources', 'prefetch', reference=recipe.reference):
+                print(f'Prefetching sources for `{recipe.reference}`...', flush=True)
+                recipe.source()
+
+            with self.lock:
+                self.prefetched[package_name] = recipe.local_source_dir
+
+            return True
+        except Exception as e:
+            # The build retrieves the sources again and reports the error
+            print(f'Failed to prefetch sources for `{recipe.reference}`: {e}', flush=True)
+            safe_rm_tree(recipe.local_source_dir)
+            return False
+        finally:
+            for semaphore in reversed(semaphores):
+                semaphore.release()
+
+    def __submit(self, package_name:str):
+        if package_name not in self.futures:
+            self.futures[package_name] = self.executor.submit(self.__prefetch, package_name)
+
+    def wait(self, package_name:str) -> bool:
+        '''
+        Waits for the prefetch of the package sources, if it was started, and starts prefetching the next packages.
+        Returns True when the sources were retrieved by the prefetcher
+        '''
+        with self.lock:
+            future = self.futures.get(package_name)
+
+            if package_name in self.build_order:
+                index = self.build_order.index(package_name)
+                for next_package_name in self.build_order[index + 1:index + 1 + self.count]:
+                    self.__submit(next_package_name)
+
+        # Prefetch that did not start yet is not awaited, the build retrieves the sources itself
+        if not future or future.cancel():
+            return False
+
+        with trace('wait for sources', 'prefetch', package=package_name):
+            try:
+                fetched = future.result()
+            except Exception as e:
+                print(f'Failed to prefetch sources for `{package_name}`: {e}', flush=True)
+                fetched = False
+
+        with self.lock:
+            self.prefetched.pop(package_name, None)
+
+        return fetched
+
+    def shutdown(self, keep_sources:bool=False):
+        for future in self.futures.values():
+            future.cancel()
+
+        self.executor.shutdown(wait=True)
+
+        # Sources of packages that were not built, e.g. because of a failed dependency
+        if not keep_sources:
+            for source_dir in self.prefetched.values():
+                safe_rm_tree(source_dir)
@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+__trace_file = None
+__events = []
+__thread_names = {}
+__lock = threading.Lock()
+
+
+def enable_tracing(trace_file:str):
+    global __trace_file
+    __trace_file = os.path.abspath(trace_file)
+
+
+def is_tracing_enabled():
+    return __trace_file is not None
+
+
+def __timestamp():
+    return time.perf_counter_ns() // 1000
+
+
+@contextmanager
+def trace(name:str, category:str, **args):
+    '''
+    Records the wrapped block as a complete event of Chrome trace format
+    '''
+    if not __trace_file:
+        yield
+        return
+
+    thread = threading.current_thread()
+    start = __timestamp()
+
+    try:
+        yield
+    except BaseException as e:
+        args['error'] = str(e)
+        raise
+    finally:
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start,
+            'dur': __timestamp() - start,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': { key: value if isinstance(value, (int, float, bool, list)) else str(value) for key, value in args.items() },
+        }
+
+        with __lock:
+            __events.append(event)
+            __thread_names[thread.ident] = thread.name
+
+
+def write_trace():
+    if not __trace_file:
+        return
+
+    with __lock:
+        events = [{
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': os.getpid(),
+            'tid': tid,
+            'args': { 'name': thread_name },
+        } for tid, thread_name in __thread_names.items()] + __events
+
+    os.makedirs(os.path.dirname(__trace_file), exist_ok=True)
+
+    with open(__trace_file, 'w') as f:
+        json.dump({ 'traceEvents': events, 'displayTimeUnit': 'ms' }, f)
+
+    print(f'Trace written to {__trace_file}', flush=True)
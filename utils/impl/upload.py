@@ -2,12 +2,14 @@ import os
 from impl.remotes import add_remote, remove_remote
 from impl.conan_recipe_store import get_recipe
 from impl.package_reference import PackageReference
+from impl.lockfile import get_locked_revisions
+from impl.tracing import trace
 
 recipes_remote_name = "conan-utils-audacity-recipes-conan2"
 binaries_remote_name = "conan-utils-audacity-binaries-conan2"
 
 
-def upload_all(recipes_remote:str, binaries_remote:str, upload_build_tools:bool, build_order:list[str]) -> None:
+def upload_all(recipes_remote:str, binaries_remote:str, upload_build_tools:bool, build_order:list[str], lockfile:str=None) -> None:
     if not recipes_remote:
         recipes_remote = os.environ.get('CONAN_RECIPES_REMOTE', "https://artifactory.audacityteam.org/artifactory/api/conan/audacity-recipes-conan2")
     if not binaries_remote:
@@ -17,6 +19,7 @@ def upload_all(recipes_remote:str, binaries_remote:str, upload_build_tools:bool,
     binaries_added = add_remote(binaries_remote_name, binaries_remote)
 
     failed_packages = []
+    locked_revisions = get_locked_revisions(lockfile)
 
     try:
         for package_name in build_order:
@@ -26,8 +29,10 @@ def upload_all(recipes_remote:str, binaries_remote:str, upload_build_tools:bool,
             if not recipe.is_build_tool or upload_build_tools:
                 print(f'Uploading {package_reference}', flush=True)
                 try:
-                    recipe.upload(recipes_remote_name, False)
-                    recipe.upload(binaries_remote_name, True)
+                    revision = locked_revisions.get(str(package_reference), None)
+                    with trace('upload_package', 'upload', reference=package_reference):
+                        recipe.upload(recipes_remote_name, False, revision)
+                        recipe.upload(binaries_remote_name, True, revision)
                 except Exception as e:
                     print(f'Failed to upload {package_reference}: {e}', flush=True)
                     failed_packages.append(package_reference)
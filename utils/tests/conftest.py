@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of conan-utils are imported as `impl.*`, the same way conan-utils.py does
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..')))
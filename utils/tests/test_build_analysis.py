@@ -0,0 +1,54 @@
+import pytest
+
+from impl.build_analysis import get_build_waves, get_critical_path
+
+
+def test_critical_path_of_chain():
+    dependencies = { 'zlib': set(), 'libpng': { 'zlib' }, 'freetype': { 'libpng' } }
+
+    assert get_critical_path(dependencies, { 'zlib': 1, 'libpng': 2, 'freetype': 3 }) == (['zlib', 'libpng', 'freetype'], 6)
+
+
+def test_critical_path_follows_longest_branch():
+    dependencies = { 'zlib': set(), 'expat': set(), 'libpng': { 'zlib' }, 'qt': { 'libpng', 'expat' } }
+
+    assert get_critical_path(dependencies, { 'zlib': 1, 'expat': 10, 'libpng': 2, 'qt': 5 }) == (['expat', 'qt'], 15)
+    assert get_critical_path(dependencies, { 'zlib': 10, 'expat': 1, 'libpng': 2, 'qt': 5 }) == (['zlib', 'libpng', 'qt'], 17)
+
+
+def test_critical_path_with_disconnected_package():
+    dependencies = { 'zlib': set(), 'libpng': { 'zlib' }, 'ninja': set() }
+
+    assert get_critical_path(dependencies, { 'zlib': 1, 'libpng': 1, 'ninja': 5 }) == (['ninja'], 5)
+    assert get_critical_path(dependencies, { 'zlib': 3, 'libpng': 3, 'ninja': 5 }) == (['zlib', 'libpng'], 6)
+
+
+def test_critical_path_without_packages():
+    assert get_critical_path({}, {}) == ([], 0.0)
+
+
+def test_critical_path_with_cycle():
+    with pytest.raises(RuntimeError, match='cycle'):
+        get_critical_path({ 'zlib': { 'libpng' }, 'libpng': { 'zlib' } }, { 'zlib': 1, 'libpng': 1 })
+
+
+def test_build_waves():
+    dependencies = { 'zlib': set(), 'expat': set(), 'libpng': { 'zlib' }, 'freetype': { 'zlib', 'libpng' }, 'fontconfig': { 'expat', 'freetype' } }
+
+    assert get_build_waves(dependencies) == [['expat', 'zlib'], ['libpng'], ['freetype'], ['fontconfig']]
+
+
+def test_build_waves_with_disconnected_package():
+    dependencies = { 'zlib': set(), 'libpng': { 'zlib' }, 'ninja': set() }
+
+    assert get_build_waves(dependencies) == [['ninja', 'zlib'], ['libpng']]
+
+
+def test_build_waves_with_dependency_without_entry():
+    # Dependencies may only be listed as dependencies of other packages
+    assert get_build_waves({ 'libpng': { 'zlib' } }) == [['zlib'], ['libpng']]
+
+
+def test_build_waves_with_cycle():
+    with pytest.raises(RuntimeError, match='cycle: freetype, harfbuzz'):
+        get_build_waves({ 'zlib': set(), 'freetype': { 'zlib', 'harfbuzz' }, 'harfbuzz': { 'freetype' } })
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from impl import build_journal
+from impl.build_journal import get_journal_path, load_journal, start_journal
+from impl.config import directories
+from impl.profiles import ConanProfiles
+
+
+@pytest.fixture
+def package_options(tmp_path, monkeypatch):
+    options = { 'zlib': { 'options': 'zlib/*:shared=False' }, 'libpng': {} }
+    monkeypatch.setattr(directories, 'temp_dir', str(tmp_path / 'temp'))
+    monkeypatch.setattr(build_journal.package_config_provider, 'get_package_config', lambda package_name: options.get(package_name, None))
+    return options
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    for name in ('host.profile', 'build.profile'):
+        (tmp_path / name).write_text('[settings]\n')
+    return ConanProfiles(str(tmp_path / 'host.profile'), str(tmp_path / 'build.profile'))
+
+
+def test_resume(package_options, profiles):
+    journal = start_journal('build', ['zlib', 'libpng'], profiles, ['audacity'])
+    journal.mark_completed('zlib')
+
+    resumed = load_journal('build')
+
+    assert resumed.build_order == ['zlib', 'libpng']
+    assert resumed.completed == ['zlib']
+    assert resumed.remotes == ['audacity']
+    assert resumed.profiles.host_profile == profiles.host_profile
+    assert resumed.profiles.build_profile == profiles.build_profile
+
+    resumed.finish()
+    assert not os.path.exists(get_journal_path())
+
+
+def test_resume_without_journal(package_options):
+    with pytest.raises(Exception, match='Nothing to resume'):
+        load_journal('build')
+
+
+def test_resume_other_command(package_options, profiles):
+    start_journal('install', ['zlib'], profiles, None)
+
+    with pytest.raises(Exception, match='was created by `install`'):
+        load_journal('build')
+
+
+def test_resume_with_changed_options(package_options, profiles):
+    start_journal('build', ['zlib', 'libpng'], profiles, None).mark_completed('zlib')
+
+    package_options['zlib']['options'] = 'zlib/*:shared=True'
+
+    with pytest.raises(Exception, match='options changed'):
+        load_journal('build')
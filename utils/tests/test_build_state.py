@@ -0,0 +1,63 @@
+import os
+
+from types import SimpleNamespace
+
+import pytest
+
+from impl.build_state import compute_input_hash
+from impl.config import directories
+
+
+@pytest.fixture
+def recipe(tmp_path, monkeypatch):
+    monkeypatch.setattr(directories, 'config_dir', str(tmp_path / 'config'))
+
+    recipe_dir = tmp_path / 'recipes' / 'zlib' / 'all'
+    recipe_dir.mkdir(parents=True)
+    (recipe_dir / 'conanfile.py').write_text('from conan import ConanFile\n')
+
+    return SimpleNamespace(recipe_dir=str(recipe_dir), reference=SimpleNamespace(name='zlib'))
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    profiles_dir = tmp_path / 'profiles'
+    (profiles_dir / 'common').mkdir(parents=True)
+    (profiles_dir / 'common' / 'gcc.profile').write_text('[settings]\ncompiler=gcc\n')
+    (profiles_dir / 'host.profile').write_text('include(common/gcc.profile)\n[settings]\nbuild_type=Release\n')
+    (profiles_dir / 'build.profile').write_text('[settings]\nbuild_type=Release\n')
+
+    return SimpleNamespace(host_profile=str(profiles_dir / 'host.profile'), build_profile=str(profiles_dir / 'build.profile'))
+
+
+def test_input_hash_is_stable(recipe, profiles):
+    assert compute_input_hash(recipe, profiles) == compute_input_hash(recipe, profiles)
+
+
+def test_input_hash_follows_profile_includes(recipe, profiles):
+    input_hash = compute_input_hash(recipe, profiles)
+
+    with open(os.path.join(os.path.dirname(profiles.host_profile), 'common', 'gcc.profile'), 'a') as f:
+        f.write('compiler.version=13\n')
+
+    assert compute_input_hash(recipe, profiles) != input_hash
+
+
+def test_input_hash_ignores_local_folders(recipe, profiles):
+    input_hash = compute_input_hash(recipe, profiles)
+
+    for path in ('src/zlib.c', 'build-release/CMakeCache.txt', 'test_package/build/main.o'):
+        os.makedirs(os.path.dirname(os.path.join(recipe.recipe_dir, path)), exist_ok=True)
+        with open(os.path.join(recipe.recipe_dir, path), 'w') as f:
+            f.write(path)
+
+    assert compute_input_hash(recipe, profiles) == input_hash
+
+    with open(os.path.join(recipe.recipe_dir, 'conanfile.py'), 'a') as f:
+        f.write('\n')
+
+    assert compute_input_hash(recipe, profiles) != input_hash
+
+
+def test_input_hash_depends_on_dependencies(recipe, profiles):
+    assert compute_input_hash(recipe, profiles, { 'zlib': 'a' }) != compute_input_hash(recipe, profiles, { 'zlib': 'b' })
@@ -0,0 +1,91 @@
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+from impl import recipe_revision
+
+reference = 'zlib/1.3@audacity/stable'
+
+recipe_files = {
+    'conanfile.py': 'from conan import ConanFile\n',
+    'conandata.yml': 'sources: {}\n',
+    'patches/0001-fix.patch': '--- a\n+++ b\n',
+}
+
+
+def write_files(root:str, files:dict[str, str]):
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), 'w', newline='\n') as f:
+            f.write(content)
+
+
+def export_recipe(conan_home_dir:str, recipe_dir:str):
+    '''
+    Writes the export folder and the cache database the way `conan export` does in `hash` revision mode
+    '''
+    export_dir = os.path.join(conan_home_dir, 'p', 'zlib1234', 'e')
+    write_files(export_dir, { path if path.startswith('conan') else f'export_source/{path}': content for path, content in recipe_files.items() })
+
+    manifest = { path if path.startswith('conan') else f'export_source/{path}': hashlib.md5(content.encode('utf-8')).hexdigest() for path, content in recipe_files.items() }
+    lines = [f'{path}: {md5}' for path, md5 in sorted(manifest.items())]
+    rrev = hashlib.md5(('\n'.join(lines) + '\n').encode('utf-8')).hexdigest()
+
+    with open(os.path.join(export_dir, 'conanmanifest.txt'), 'w', newline='\n') as f:
+        f.write('1700000000\n' + '\n'.join(lines) + '\n')
+
+    con = sqlite3.connect(os.path.join(conan_home_dir, 'p', 'cache.sqlite3'))
+    con.execute('CREATE TABLE recipes (reference, rrev, path, timestamp, lru, PRIMARY KEY (reference, rrev))')
+    con.execute('INSERT INTO recipes VALUES (?, ?, ?, 1, 1)', (reference, rrev, 'zlib1234'))
+    con.commit()
+    con.close()
+
+    return rrev
+
+
+@pytest.fixture
+def recipe_dir(tmp_path, monkeypatch):
+    conan_home_dir = str(tmp_path / 'conan')
+    monkeypatch.setattr(recipe_revision, 'get_conan_home_path', lambda: conan_home_dir)
+
+    recipe_dir = str(tmp_path / 'recipes' / 'zlib' / 'all')
+    write_files(recipe_dir, recipe_files)
+    # Local files which are never exported
+    write_files(recipe_dir, { 'CMakeUserPresets.json': '{}', 'test_package/conanfile.py': '', 'src/zlib.c': '' })
+
+    export_recipe(conan_home_dir, recipe_dir)
+    return recipe_dir
+
+
+def test_not_exported(tmp_path, monkeypatch):
+    monkeypatch.setattr(recipe_revision, 'get_conan_home_path', lambda: str(tmp_path / 'conan'))
+    assert not recipe_revision.is_recipe_exported(str(tmp_path), reference)
+
+
+def test_revision_matches_manifest(recipe_dir):
+    rrev, export_path = recipe_revision.get_latest_recipe_revision(reference)
+    files = recipe_revision.read_manifest(os.path.join(export_path, 'conanmanifest.txt'))
+
+    assert sorted(files) == ['conandata.yml', 'conanfile.py', 'export_source/patches/0001-fix.patch']
+    assert recipe_revision.compute_revision(recipe_dir, files) == rrev
+    assert recipe_revision.is_recipe_exported(recipe_dir, reference)
+
+
+@pytest.mark.parametrize('path', ['conanfile.py', 'patches/0001-fix.patch'])
+def test_modified_file(recipe_dir, path):
+    with open(os.path.join(recipe_dir, path), 'a') as f:
+        f.write('\n')
+
+    assert not recipe_revision.is_recipe_exported(recipe_dir, reference)
+
+
+def test_removed_file(recipe_dir):
+    os.unlink(os.path.join(recipe_dir, 'patches', '0001-fix.patch'))
+    assert not recipe_revision.is_recipe_exported(recipe_dir, reference)
+
+
+def test_extra_file(recipe_dir):
+    write_files(recipe_dir, { 'patches/0002-fix.patch': '--- a\n+++ b\n' })
+    assert not recipe_revision.is_recipe_exported(recipe_dir, reference)
@@ -0,0 +1,154 @@
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+from impl import remote_cache
+from impl.cache_snapshot import get_blob_path, snapshot_suffix
+from impl.config import directories
+
+
+class FakeArtifactory:
+    '''
+    In-memory replacement of ArtifactoryInstance
+    '''
+    def __init__(self):
+        self.files = {}
+
+    def upload_stream(self, remote_path:str, chunks) -> str:
+        self.files[remote_path] = b''.join(chunks)
+        return self.get_file_url(remote_path)
+
+    def get_file_url(self, remote_path:str) -> str:
+        return f'fake://{remote_path}'
+
+    def file_exists(self, remote_path:str) -> bool:
+        return remote_path in self.files
+
+    def get_stream(self, remote_path:str, chunk_size:int=1024):
+        data = self.files[remote_path]
+        for offset in range(0, len(data), chunk_size):
+            yield data[offset:offset + chunk_size]
+
+    def get_file(self, remote_path:str, local_path:str):
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, 'wb') as f:
+            f.write(self.files[remote_path])
+
+    def list_files(self, remote_path:str) -> list[str]:
+        return [path for path in self.files if path.startswith(remote_path)]
+
+    def delete_uri(self, remote_path:str):
+        self.files = { path: data for path, data in self.files.items() if not path.startswith(remote_path) }
+
+
+def create_conan_home(conan_home_dir:str):
+    storage_dir = os.path.join(conan_home_dir, 'p')
+
+    for path in ('zlib1234', os.path.join('b', 'zlib5678'), 'qt1234', os.path.join('b', 'qt5678')):
+        os.makedirs(os.path.join(storage_dir, path))
+        with open(os.path.join(storage_dir, path, 'conanmanifest.txt'), 'w') as f:
+            f.write(path)
+
+    with open(os.path.join(conan_home_dir, 'global.conf'), 'w') as f:
+        f.write('core:non_interactive=True\n')
+
+    con = sqlite3.connect(os.path.join(storage_dir, 'cache.sqlite3'))
+    con.execute('CREATE TABLE recipes (reference, rrev, path, timestamp, lru, PRIMARY KEY (reference, rrev))')
+    con.execute('CREATE TABLE packages (reference, rrev, pkgid, prev, path, timestamp, build_id, lru, PRIMARY KEY (reference, rrev, pkgid, prev))')
+    con.executemany('INSERT INTO recipes VALUES (?, ?, ?, 1, 1)', [('zlib/1.3', 'r1', 'zlib1234'), ('qt/6.8', 'r2', 'qt1234')])
+    con.executemany('INSERT INTO packages VALUES (?, ?, ?, ?, ?, 1, NULL, 1)', [('zlib/1.3', 'r1', 'p1', 'v1', 'b/zlib5678'), ('qt/6.8', 'r2', 'p2', 'v2', 'b/qt5678')])
+    con.commit()
+    con.close()
+
+
+def read_cache_paths(conan_home_dir:str):
+    con = sqlite3.connect(os.path.join(conan_home_dir, 'p', 'cache.sqlite3'))
+    try:
+        return sorted(row[0] for row in con.execute('SELECT path FROM recipes UNION ALL SELECT path FROM packages'))
+    finally:
+        con.close()
+
+
+@pytest.fixture
+def fake_artifactory(tmp_path, monkeypatch):
+    artifactory = FakeArtifactory()
+    monkeypatch.setattr(remote_cache, 'get_artifactory', lambda *args, **kwargs: artifactory)
+    monkeypatch.setattr(directories, 'conan_home_dir', str(tmp_path / 'conan'))
+    monkeypatch.setattr(directories, 'temp_dir', str(tmp_path / 'temp'))
+    create_conan_home(directories.conan_home_dir)
+    return artifactory
+
+
+@pytest.mark.parametrize('cache_format', ['archive', 'snapshot', 'packages'])
+def test_store_and_restore_cache(tmp_path, fake_artifactory, cache_format):
+    remote_cache.upload_cache(None, None, None, None, 'group', 'cache', compression='gz', cache_format=cache_format)
+
+    build_order_path = tmp_path / 'build_order.yml'
+    build_order_path.write_text("build_order:\n  - platforms: '*'\n    packages: [zlib]\n")
+
+    directories.conan_home_dir = str(tmp_path / 'restored')
+    remote_cache.restore_cache(None, None, None, None, 'group', 'cache', compression='gz', build_order=str(build_order_path))
+
+    assert os.path.isfile(os.path.join(directories.conan_home_dir, 'p', 'b', 'zlib5678', 'conanmanifest.txt'))
+    assert os.path.isfile(os.path.join(directories.conan_home_dir, 'global.conf'))
+
+    if cache_format == 'packages':
+        # Only the packages of the build order are restored
+        assert read_cache_paths(directories.conan_home_dir) == ['b/zlib5678', 'zlib1234']
+        assert not os.path.exists(os.path.join(directories.conan_home_dir, 'p', 'qt1234'))
+    else:
+        assert read_cache_paths(directories.conan_home_dir) == ['b/qt5678', 'b/zlib5678', 'qt1234', 'zlib1234']
+
+
+def test_restore_archive_with_other_compression(tmp_path, fake_artifactory):
+    remote_cache.upload_cache(None, None, None, None, 'group', 'cache', compression='gz')
+
+    directories.conan_home_dir = str(tmp_path / 'restored')
+    remote_cache.restore_cache(None, None, None, None, 'group', 'cache')
+
+    assert read_cache_paths(directories.conan_home_dir) == ['b/qt5678', 'b/zlib5678', 'qt1234', 'zlib1234']
+
+
+@pytest.mark.parametrize('cache_format', ['archive', 'snapshot', 'packages'])
+def test_delete_cache_keeps_shared_files(tmp_path, fake_artifactory, cache_format):
+    os.makedirs(os.path.join(directories.temp_dir, 'debug_processors'))
+    remote_cache.upload_cache(None, None, None, None, 'group', 'cache', compression='gz', cache_format=cache_format)
+    remote_cache.upload_cache(None, None, None, None, 'group', 'other', compression='gz', cache_format=cache_format)
+
+    shared_files = { path for path in fake_artifactory.files if path.startswith(('group/blobs/', 'group/packages/')) }
+
+    remote_cache.delete_cache(None, None, None, None, 'group', 'cache')
+
+    assert not any('/cache.' in path for path in fake_artifactory.files)
+    assert shared_files <= set(fake_artifactory.files)
+
+    directories.conan_home_dir = str(tmp_path / 'restored')
+    remote_cache.restore_cache(None, None, None, None, 'group', 'other')
+
+    assert os.path.isfile(os.path.join(directories.conan_home_dir, 'p', 'b', 'zlib5678', 'conanmanifest.txt'))
+
+
+def test_failed_restore_keeps_local_cache(tmp_path, fake_artifactory):
+    remote_cache.upload_cache(None, None, None, None, 'group', 'cache', compression='gz', cache_format='snapshot')
+
+    directories.conan_home_dir = str(tmp_path / 'restored')
+    create_conan_home(directories.conan_home_dir)
+
+    con = sqlite3.connect(os.path.join(directories.conan_home_dir, 'p', 'cache.sqlite3'))
+    con.execute("DELETE FROM recipes WHERE reference = 'qt/6.8'")
+    con.execute("DELETE FROM packages WHERE reference = 'qt/6.8'")
+    con.commit()
+    con.close()
+
+    # Files are restored in order, so the cache database is restored before the missing file
+    manifest = json.loads(fake_artifactory.files[f'group/conan/{sys.platform.lower()}/cache{snapshot_suffix}'])
+    missing_file = next(file for file in manifest['files'] if file['path'] == 'conan/p/zlib1234/conanmanifest.txt')
+    del fake_artifactory.files[get_blob_path('group', missing_file['sha256'], 'gz')]
+
+    with pytest.raises(Exception):
+        remote_cache.restore_cache(None, None, None, None, 'group', 'cache', compression='gz', jobs=1)
+
+    assert read_cache_paths(directories.conan_home_dir) == ['b/zlib5678', 'zlib1234']
@@ -0,0 +1,133 @@
+import threading
+
+import pytest
+
+from impl.scheduler import BuildScheduler, run_build_order
+
+
+class Recorder:
+    '''
+    Action recording the order in which packages are processed
+    '''
+    def __init__(self, failing:set[str] = None):
+        self.failing = failing or set()
+        self.order = []
+        self.lock = threading.Lock()
+
+    def __call__(self, package_name:str):
+        with self.lock:
+            self.order.append(package_name)
+
+        if package_name in self.failing:
+            raise RuntimeError(f'{package_name} failed')
+
+
+class RefusingPlanner:
+    '''
+    Memory planner without memory for any package, unless the reservation is forced
+    '''
+    def __init__(self):
+        self.reservations = []
+        self.running = set()
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def try_reserve(self, package_name:str, force:bool=False) -> bool:
+        with self.lock:
+            self.reservations.append((package_name, force))
+            if not force:
+                return False
+            self.running.add(package_name)
+            self.max_running = max(self.max_running, len(self.running))
+            return True
+
+    def release(self, package_name:str):
+        with self.lock:
+            self.running.discard(package_name)
+
+
+class FakeJournal:
+    def __init__(self, completed:list[str]):
+        self.completed = list(completed)
+        self.finished = False
+
+    def mark_completed(self, package_name:str):
+        self.completed.append(package_name)
+
+    def finish(self):
+        self.finished = True
+
+
+def test_dependencies_are_processed_first():
+    dependencies = { 'zlib': set(), 'libpng': { 'zlib' }, 'freetype': { 'zlib', 'libpng' }, 'expat': set() }
+    recorder = Recorder()
+
+    BuildScheduler(['zlib', 'libpng', 'freetype', 'expat'], dependencies, jobs=4).run(recorder)
+
+    assert sorted(recorder.order) == ['expat', 'freetype', 'libpng', 'zlib']
+    for package_name, package_dependencies in dependencies.items():
+        assert all(recorder.order.index(dependency) < recorder.order.index(package_name) for dependency in package_dependencies)
+
+
+def test_longest_path_starts_first():
+    dependencies = { 'expat': set(), 'zlib': set(), 'qt': { 'zlib' } }
+    recorder = Recorder()
+
+    scheduler = BuildScheduler(['expat', 'zlib', 'qt'], dependencies, jobs=1, durations={ 'expat': 10, 'zlib': 1, 'qt': 100 })
+    scheduler.run(recorder)
+
+    assert scheduler.priorities == { 'expat': 10, 'zlib': 101, 'qt': 100 }
+    assert recorder.order == ['zlib', 'qt', 'expat']
+
+
+def test_failure_skips_only_downstream():
+    dependencies = { 'zlib': set(), 'libpng': { 'zlib' }, 'freetype': { 'libpng' }, 'expat': set(), 'fontconfig': { 'expat' } }
+    recorder = Recorder(failing={ 'zlib' })
+
+    scheduler = BuildScheduler(['zlib', 'libpng', 'freetype', 'expat', 'fontconfig'], dependencies, jobs=2)
+
+    with pytest.raises(Exception, match='Failed to process some packages'):
+        scheduler.run(recorder)
+
+    assert list(scheduler.failed.keys()) == ['zlib']
+    assert scheduler.skipped == { 'libpng': 'zlib', 'freetype': 'zlib' }
+    assert sorted(scheduler.completed) == ['expat', 'fontconfig']
+    assert 'libpng' not in recorder.order and 'freetype' not in recorder.order
+
+
+def test_cycle_is_reported():
+    with pytest.raises(RuntimeError, match='Unable to schedule packages'):
+        BuildScheduler(['zlib', 'libpng'], { 'zlib': { 'libpng' }, 'libpng': { 'zlib' } }, jobs=2).run(Recorder())
+
+
+def test_reservation_is_forced_when_nothing_is_running():
+    planner = RefusingPlanner()
+    recorder = Recorder()
+
+    BuildScheduler(['zlib', 'expat', 'libpng'], {}, jobs=3, memory_planner=planner).run(recorder)
+
+    # Packages that don't fit run one at a time instead of waiting forever
+    assert sorted(recorder.order) == ['expat', 'libpng', 'zlib']
+    assert planner.max_running == 1
+    assert sorted(package_name for package_name, force in planner.reservations if force) == ['expat', 'libpng', 'zlib']
+
+
+def test_journal_skips_completed_packages():
+    journal = FakeJournal(['zlib'])
+    recorder = Recorder()
+
+    run_build_order(['zlib', 'libpng'], { 'libpng': { 'zlib' } }, recorder, jobs=2, journal=journal)
+
+    assert recorder.order == ['libpng']
+    assert journal.completed == ['zlib', 'libpng']
+    assert journal.finished
+
+
+def test_journal_is_not_finished_on_failure():
+    journal = FakeJournal([])
+
+    with pytest.raises(Exception):
+        run_build_order(['zlib', 'libpng'], { 'libpng': { 'zlib' } }, Recorder(failing={ 'zlib' }), jobs=2, journal=journal)
+
+    assert journal.completed == []
+    assert not journal.finished